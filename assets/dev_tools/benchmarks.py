@@ -0,0 +1,433 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import concurrent.futures
+import threading
+import argparse
+import time
+import sys
+import os
+
+# NOTE: benchmark the cha package in this repository, not the installed one
+CHA_ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if CHA_ROOT_DIR not in sys.path:
+    sys.path.insert(0, CHA_ROOT_DIR)
+
+
+def underline(text):
+    return f"\u001b[4m{text}\u001b[0m"
+
+
+def start_local_http_server(body=b"<html><body><p>cha</p></body></html>"):
+    stats = {"connections": 0, "requests": 0}
+    stats_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        # NOTE: HTTP/1.1 is required for keep-alive connections
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with stats_lock:
+                stats["connections"] += 1
+
+        def do_GET(self):
+            with stats_lock:
+                stats["requests"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, stats
+
+
+def _legacy_get_request(url):
+    # NOTE: mirrors the old utils.get_request which built a new session for every call
+    from requests.packages.urllib3.util.retry import Retry
+    from requests.adapters import HTTPAdapter
+    import requests
+
+    from cha import config
+
+    retries = Retry(
+        total=config.REQUEST_DEFAULT_RETRY_COUNT,
+        backoff_factor=config.REQUEST_BACKOFF_FACTOR,
+        status_forcelist=list(range(400, 600)),
+    )
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(max_retries=retries))
+    session.mount("https://", HTTPAdapter(max_retries=retries))
+    response = session.get(
+        url,
+        timeout=config.REQUEST_DEFAULT_TIMEOUT_SECONDS,
+        headers=config.REQUEST_DEFAULT_HEADERS,
+    )
+    response.raise_for_status()
+    return response
+
+
+def run_http_pool_benchmark(total_requests=200, workers=15):
+    from cha import utils
+
+    server, stats = start_local_http_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    print(underline("HTTP Session Pool") + "\n")
+    try:
+        for name, func in [
+            ("new session per call", _legacy_get_request),
+            ("shared pooled session", utils.get_request),
+        ]:
+            stats["connections"], stats["requests"] = 0, 0
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+                list(ex.map(lambda _: func(url), range(total_requests)))
+            runtime = time.perf_counter() - start
+
+            reused = stats["requests"] - stats["connections"]
+            print(
+                f"{name:<22} | {stats['requests']} requests | "
+                f"{stats['connections']} connections created | "
+                f"{reused} reused | {runtime:.4f} seconds"
+            )
+    finally:
+        server.shutdown()
+
+
+HTML_CORPUS_DIR = os.path.join(os.path.dirname(__file__), "html_corpus")
+
+
+def _legacy_remove_html(content):
+    # NOTE: mirrors the old scraper.remove_html which filtered every character against a rebuilt set
+    from bs4 import BeautifulSoup
+    import string
+    import re
+
+    soup = BeautifulSoup(content, "html.parser")
+    for data in soup(["style", "script"]):
+        data.decompose()
+    tmp = " ".join(soup.stripped_strings)
+    tmp = "".join(filter(lambda x: x in set(string.printable), tmp))
+    tmp = re.sub(" +", " ", tmp)
+    return tmp
+
+
+def run_html_extract_benchmark(corpus_dir=HTML_CORPUS_DIR, iterations=10):
+    from cha import extract
+
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+                pages.append(f.read())
+    total_mb = sum(len(page.encode("utf-8")) for page in pages) * iterations / 1e6
+
+    print(underline("HTML To Text Extraction") + "\n")
+    print(f"{len(pages)} pages x {iterations} iterations ({total_mb:.2f} MB)\n")
+
+    backends = [("legacy bs4 + set filter", _legacy_remove_html)]
+    for name in extract.available_extractors():
+        backends.append((name, lambda page, name=name: extract.html_to_text(page, name)))
+
+    for name, func in backends:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for page in pages:
+                func(page)
+        runtime = time.perf_counter() - start
+        print(f"{name:<24} | {total_mb / runtime:8.2f} MB/s | {runtime:.4f} seconds")
+
+
+def _legacy_count_tokens(text, model_name):
+    # NOTE: mirrors the old utils.count_tokens which looked up the encoding on every call
+    # (special token checks are off, the old code returned None for text containing them)
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(model_name)
+        return len(encoding.encode(text, disallowed_special=()))
+    except:
+        new_model_name = "o1" if model_name.startswith("o") else "gpt-4o"
+        encoding = tiktoken.encoding_for_model(new_model_name)
+        return len(encoding.encode(text, disallowed_special=()))
+
+
+def _load_codedump_sized_inputs(copies=5):
+    # the python files of this repo, repeated, stand in for a typical codedump
+    texts = []
+    for root, _, files in os.walk(os.path.join(CHA_ROOT_DIR, "cha")):
+        for name in sorted(files):
+            if name.endswith(".py"):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    texts.append(f.read())
+    return texts * copies
+
+
+def run_token_count_benchmark(model_name=None):
+    from cha import utils, config
+
+    model_name = model_name or config.DEFAULT_SEARCH_BIG_MODEL
+    texts = _load_codedump_sized_inputs()
+    total_mb = sum(len(text.encode("utf-8")) for text in texts) / 1e6
+
+    print(underline("Token Counting") + "\n")
+
+    start = time.perf_counter()
+    encoder = utils.get_token_encoder(model_name)
+    load_time = time.perf_counter() - start
+    if encoder is None:
+        print(f"Failed to load the tiktoken encoding for {model_name} (offline?)")
+        return
+    print(f"{len(texts)} texts ({total_mb:.2f} MB) with {model_name}")
+    print(f"first encoder load took {load_time:.4f} seconds\n")
+
+    for name, func in [
+        (
+            "lookup per call",
+            lambda: [_legacy_count_tokens(text, model_name) for text in texts],
+        ),
+        (
+            "cached encoder",
+            lambda: [utils.count_tokens(text, model_name) for text in texts],
+        ),
+        ("batch api", lambda: utils.count_tokens_batch(texts, model_name)),
+    ]:
+        start = time.perf_counter()
+        counts = func()
+        runtime = time.perf_counter() - start
+        print(
+            f"{name:<16} | {sum(counts)} tokens | {total_mb / runtime:8.2f} MB/s | {runtime:.4f} seconds"
+        )
+
+
+def _legacy_matches_specific_includes(file_path, root_path, specific_includes):
+    # NOTE: mirrors the old codedump.matches_specific_includes (per file x per pattern, isdir and fnmatch every time)
+    import fnmatch
+
+    if not specific_includes:
+        return False
+
+    rel_path = os.path.relpath(file_path, root_path)
+
+    for include_pattern in specific_includes:
+        include_pattern = include_pattern.strip()
+        if not include_pattern:
+            continue
+
+        if os.path.isdir(os.path.join(root_path, include_pattern)):
+            if not include_pattern.endswith("/"):
+                include_pattern += "/"
+
+        if rel_path == include_pattern or rel_path == include_pattern.rstrip("/"):
+            return True
+
+        if include_pattern.endswith("/") and rel_path.startswith(include_pattern):
+            return True
+
+        if fnmatch.fnmatch(rel_path, include_pattern):
+            return True
+
+        parent_path = os.path.dirname(rel_path)
+        while parent_path:
+            if fnmatch.fnmatch(
+                parent_path, include_pattern
+            ) or parent_path == include_pattern.rstrip("/"):
+                return True
+            parent_path = os.path.dirname(parent_path)
+
+    return False
+
+
+def run_include_match_benchmark(file_count=50_000, pattern_count=20):
+    import random
+
+    from cha import codedump
+
+    # a synthetic monorepo layout, rooted at this repo so the isdir checks hit a real directory
+    random.seed(0)
+    dir_names = ["src", "lib", "pkg", "internal", "api", "web", "tests", "docs", "cmd"]
+    file_names = ["main.py", "utils.go", "index.ts", "README.md", "model.rs", "a.c"]
+    rel_paths = [
+        "/".join(random.choice(dir_names) for _ in range(random.randint(1, 6)))
+        + f"/{i}_{random.choice(file_names)}"
+        for i in range(file_count)
+    ]
+    patterns = (
+        [f"*.{ext}" for ext in ["md", "rs", "c"]]
+        + [f"{name}/" for name in dir_names[:5]]
+        + [f"*/{name}/*" for name in dir_names[5:]]
+        + [f"{a}/{b}" for a, b in zip(dir_names, reversed(dir_names))]
+    )[:pattern_count]
+    abs_paths = [os.path.join(CHA_ROOT_DIR, rel) for rel in rel_paths]
+
+    print(underline("Include Pattern Matching") + "\n")
+    print(f"{file_count} files x {len(patterns)} patterns\n")
+
+    start = time.perf_counter()
+    legacy = [
+        _legacy_matches_specific_includes(path, CHA_ROOT_DIR, patterns)
+        for path in abs_paths
+    ]
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = codedump.IncludeMatcher(CHA_ROOT_DIR, patterns)
+    compiled = [matcher.matches(rel) for rel in rel_paths]
+    compiled_time = time.perf_counter() - start
+
+    for name, runtime, results in [
+        ("per file x pattern", legacy_time, legacy),
+        ("compiled", compiled_time, compiled),
+    ]:
+        print(f"{name:<20} | {sum(results)} matched | {runtime:.4f} seconds")
+    print(f"\nresults identical: {legacy == compiled}")
+
+
+class _CountingSink:
+    # a stdout stand-in that writes to /dev/null and counts the write/flush calls
+    def __init__(self):
+        self.devnull = open(os.devnull, "w")
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes += 1
+        self.devnull.write(text)
+
+    def flush(self):
+        self.flushes += 1
+        self.devnull.flush()
+
+
+def _legacy_stream_loop(chunks, sink):
+    # NOTE: mirrors the old main.chatbot loop (color, write, and flush per chunk, two string copies)
+    from cha import colors
+
+    full_response = ""
+    history_bot = ""
+    for chunk in chunks:
+        sink.write(colors.green(chunk))
+        full_response += chunk
+        history_bot += chunk
+        sink.flush()
+    return full_response
+
+
+def run_stream_render_benchmark(chunk_count=100_000):
+    import random
+
+    from cha import colors, stream
+
+    # a replayed fake stream, token sized chunks like a real model produces
+    random.seed(0)
+    words = ["the", " model", " streams", " tokens", ",", " and", "\n", " code", "()"]
+    chunks = [random.choice(words) for _ in range(chunk_count)]
+    total_kb = sum(len(chunk) for chunk in chunks) / 1024
+
+    print(underline("Streamed Output Rendering") + "\n")
+    print(f"{chunk_count} chunks ({total_kb:.0f} KB)\n")
+
+    def renderer_loop(chunks, sink):
+        renderer = stream.StreamRenderer(style=colors.green, output=sink)
+        for chunk in chunks:
+            renderer.write(chunk)
+        return renderer.close()
+
+    for name, func in [
+        ("per chunk write", _legacy_stream_loop),
+        ("stream renderer", renderer_loop),
+    ]:
+        sink = _CountingSink()
+        start = time.perf_counter()
+        output = func(chunks, sink)
+        runtime = time.perf_counter() - start
+        assert output == "".join(chunks)
+        print(
+            f"{name:<16} | {sink.writes} writes | {sink.flushes} flushes | {runtime:.4f} seconds"
+        )
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            description="Cha Benchmarks - Measure the performance of Cha's hot paths",
+            add_help=False,
+        )
+        parser.add_argument(
+            "-h",
+            "--help",
+            action="help",
+            default=argparse.SUPPRESS,
+            help="Show this help message and exit",
+        )
+        parser.add_argument(
+            "--http-pool",
+            action="store_true",
+            help="Compare connection reuse of the pooled HTTP session",
+        )
+
+        parser.add_argument(
+            "--html-extract",
+            nargs="?",
+            const=HTML_CORPUS_DIR,
+            default=None,
+            metavar="CORPUS_DIR",
+            help="Report the MB/s of each HTML to text backend over a directory of saved pages (default: html_corpus/)",
+        )
+
+        parser.add_argument(
+            "--tokens",
+            nargs="?",
+            const=True,
+            default=None,
+            metavar="MODEL",
+            help="Compare per call, cached, and batched token counting over codedump sized inputs",
+        )
+
+        parser.add_argument(
+            "--include-match",
+            action="store_true",
+            help="Compare the compiled code dump include matcher with the old per pattern loop",
+        )
+
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Compare per chunk printing with the buffered stream renderer over a 100k chunk fake stream",
+        )
+
+        args = parser.parse_args()
+
+        if not any(
+            [
+                args.http_pool,
+                args.html_extract,
+                args.tokens,
+                args.include_match,
+                args.stream,
+            ]
+        ):
+            parser.print_help()
+        else:
+            if args.http_pool:
+                run_http_pool_benchmark()
+            if args.html_extract:
+                run_html_extract_benchmark(args.html_extract)
+            if args.tokens:
+                run_token_count_benchmark(
+                    None if args.tokens is True else args.tokens
+                )
+            if args.include_match:
+                run_include_match_benchmark()
+            if args.stream:
+                run_stream_render_benchmark()
+
+    except (KeyboardInterrupt, EOFError):
+        print()
@@ -10,6 +10,9 @@ import time
 import sys
 import os
 
+# the median time from launching cha to its "User:" prompt has to stay under this
+STARTUP_TIME_BUDGET_SECONDS = 0.5
+
 
 def underline(text):
     return f"\u001b[4m{text}\u001b[0m"
@@ -86,6 +89,56 @@ def over_all_startup_time(command_path, debug_mode=False, total_runs=15):
         print("No successful runs to average.")
 
 
+def slowest_imports(module="cha.main", top=10):
+    # the modules with the largest cumulative import time, from python -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        imports.append((int(parts[1]), parts[2].strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def run_startup_budget(budget=None, total_runs=15, command="cha"):
+    """
+    Startup regression benchmark, measures the time to the "User:" prompt
+    total_runs times and checks the median against the budget. Prints the slowest
+    imports if it is over, returns True if the budget was met.
+    """
+    budget = budget or STARTUP_TIME_BUDGET_SECONDS
+    times = []
+    for i in range(total_runs):
+        try:
+            t = measure_startup_time(command=command, prompt="User:")
+            if t is not None:
+                times.append(t)
+        except TimeoutError:
+            pass
+    if not times:
+        print("No successful runs to measure.")
+        return False
+
+    times.sort()
+    p50 = times[len(times) // 2]
+    p90 = times[min(len(times) - 1, int(len(times) * 0.9))]
+    passed = p50 <= budget
+    print(f"{len(times)} of {total_runs} runs for '{command}'")
+    print(f"p50 {p50:.4f} seconds, p90 {p90:.4f} seconds, budget {budget:.4f} seconds")
+    print("PASS" if passed else "FAIL")
+    if not passed:
+        print("\nSlowest imports (cumulative):")
+        for microseconds, module in slowest_imports():
+            print(f"{microseconds / 1_000_000:.4f}s {module}")
+    return passed
+
+
 def parse_gitignore(gitignore_path):
     patterns = []
     if os.path.exists(gitignore_path):
@@ -540,6 +593,7 @@ def run_all_tests():
 
 
 if __name__ == "__main__":
+    exit_code = 0
     try:
         parser = argparse.ArgumentParser(
             description="Cha Toolkit - Run various analysis tests on the Cha project",
@@ -564,6 +618,15 @@ if __name__ == "__main__":
             action="store_true",
             help="Measure startup time performance",
         )
+        parser.add_argument(
+            "-b",
+            "--startup-budget",
+            nargs="?",
+            type=float,
+            const=STARTUP_TIME_BUDGET_SECONDS,
+            metavar="SECONDS",
+            help=f"Fail if the median startup time is over the budget (default: {STARTUP_TIME_BUDGET_SECONDS}s)",
+        )
         parser.add_argument(
             "-d",
             "--deps",
@@ -598,6 +661,7 @@ if __name__ == "__main__":
         specific_tests = [
             args.lines,
             args.startup,
+            args.startup_budget is not None,
             args.deps,
             args.git,
             args.all,
@@ -615,6 +679,9 @@ if __name__ == "__main__":
                 run_line_count()
             if args.startup:
                 run_startup_time()
+            if args.startup_budget is not None:
+                if not run_startup_budget(budget=args.startup_budget):
+                    exit_code = 1
             if args.deps:
                 run_dependencies()
             if args.git:
@@ -628,3 +695,4 @@ if __name__ == "__main__":
         print()
     except:
         pass
+    sys.exit(exit_code)
@@ -1,16 +1,17 @@
 from contextlib import redirect_stdout, redirect_stderr
 from datetime import datetime, timezone
 from pydantic import BaseModel
+import concurrent.futures
+import threading
 import requests
 import random
 import math
-import time
 import json
 import ast
 import os
 import re
 
-from cha import scraper, colors, utils, config, loading
+from cha import scraper, colors, utils, config, loading, stream
 
 
 def create_mega_prompt(search_results, prompt):
@@ -120,6 +121,25 @@ def generate_search_queries(
         return output[:min_results]
 
 
+# one token bucket per search backend, shared by every thread that searches
+_search_rate_limiters = {}
+_search_rate_limiters_lock = threading.Lock()
+
+
+def throttle_search(backend):
+    # blocks until the backend's rate limit (see config.CHA_SEARCH_RATE_LIMITS) allows a query
+    limit = (config.CHA_SEARCH_RATE_LIMITS or {}).get(backend)
+    if not limit:
+        return
+    with _search_rate_limiters_lock:
+        limiter = _search_rate_limiters.get(backend)
+        if limiter is None:
+            rate, burst = limit
+            limiter = utils.TokenBucket(rate, burst)
+            _search_rate_limiters[backend] = limiter
+    limiter.acquire()
+
+
 def search_engine(
     search_input, count=5, region="wt-wt", safesearch="off", timelimit=None
 ):
@@ -133,6 +153,7 @@ def search_engine(
                 if response.status_code != 200:
                     raise Exception("SearXNG is not running")
 
+                throttle_search("searxng")
                 response = requests.get(
                     str(searxng_base_url_str.rstrip("/") + "/search"),
                     params={"q": search_input, "format": "json"},
@@ -158,6 +179,7 @@ def search_engine(
 
         from ddgs import DDGS
 
+        throttle_search("ddgs")
         with DDGS() as ddgs:
             search_results_ddg = list(
                 ddgs.text(
@@ -183,6 +205,30 @@ def search_engine(
         return {"error": str(e)}
 
 
+def search_all_queries(search_queries, count=5):
+    """
+    Runs the search queries on a thread pool, each backend keeping to its own rate
+    limit (see throttle_search), and yields (index, results) pairs in the order the
+    queries finish, so a query's results are usable before the slowest one returns.
+    """
+    max_workers = max(1, min(config.CHA_SEARCH_MAX_CONCURRENCY, len(search_queries)))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(search_engine, query, count): index
+            for index, query in enumerate(search_queries)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                results = {"error": str(e)}
+            yield futures[future], results
+    finally:
+        # NOTE: drops the queries that did not start yet (e.g. ctrl+c)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def quick_search(user_input, min_search_result=3):
     try:
         results = search_engine(
@@ -202,21 +248,30 @@ def quick_search(user_input, min_search_result=3):
             if url not in urls:
                 urls.append(url)
 
+        descriptions = {
+            str(result["url"]): str(result.get("description")) for result in results
+        }
+
+        # NOTE: each entry is assembled as soon as its url finishes scraping
+        scrapped_data = {}
         # TODO: suppress all untraceable print statements by muting all stdout prints
         with open(os.devnull, "w") as fnull:
             with redirect_stdout(fnull), redirect_stderr(fnull):
-                scrapped_data = scraper.get_all_htmls(urls)
+                for url, content in scraper.stream_all_htmls(urls):
+                    description = descriptions.get(url, "None")
+                    if content is not None:
+                        content = str(content)
+                    if content == None or len(description) >= len(content):
+                        content = description
+                    scrapped_data[url] = {"url": url, "content": content}
 
         output = []
         for result in results:
             url = str(result["url"])
-            description = str(result.get("description"))
-            content = None
             if url in scrapped_data:
-                content = str(scrapped_data[url])
-            if content == None or len(description) >= len(content):
-                content = str(description)
-            output.append({"url": url, "content": content})
+                output.append(scrapped_data[url])
+            else:
+                output.append({"url": url, "content": descriptions[url]})
 
         return utils.rls(
             f"""
@@ -244,13 +299,117 @@ def quick_search(user_input, min_search_result=3):
         return None
 
 
+def count_prompt_tokens(text, model_name):
+    tokens = utils.count_tokens(text, model_name)
+    if tokens is None:
+        # NOTE: tiktoken fails if its encoding can not be loaded (e.g. offline), so fall back to an estimate
+        tokens = utils.count_tokens(text, model_name, fast_mode=True)
+    return tokens
+
+
+def count_paragraph_tokens(text, model_name):
+    # NOTE: counted as json strings since that is how the content is embedded in the mega prompt
+    paragraphs = text.split("\n\n")
+    serialized = [json.dumps(paragraph) for paragraph in paragraphs]
+    counts = utils.count_tokens_batch(serialized, model_name)
+    if None in counts:
+        counts = utils.count_tokens_batch(serialized, model_name, fast_mode=True)
+    return list(zip(paragraphs, counts))
+
+
+def allocate_token_budget(source_tokens, budget, max_tokens_per_source=None):
+    """
+    Splits a token budget between sources (water-filling). Smaller sources keep all
+    their tokens and whatever they leave unused is shared by the larger ones.
+    """
+    shares = {}
+    remaining_budget = max(budget, 0)
+    by_size = sorted(source_tokens.items(), key=lambda item: item[1])
+    for index, (url, tokens) in enumerate(by_size):
+        fair_share = remaining_budget // (len(by_size) - index)
+        if max_tokens_per_source is not None:
+            fair_share = min(fair_share, max_tokens_per_source)
+        shares[url] = min(tokens, fair_share)
+        remaining_budget -= shares[url]
+    return shares
+
+
+def truncate_to_token_budget(paragraphs, budget):
+    # keeps whole paragraphs while they fit, only the first paragraph is ever cut mid way
+    kept = []
+    used = 0
+    for paragraph, tokens in paragraphs:
+        if used + tokens > budget:
+            if not kept and budget > 0 and tokens > 0:
+                kept.append(paragraph[: int(len(paragraph) * budget / tokens)])
+            break
+        kept.append(paragraph)
+        used += tokens
+
+    if not kept or not any(kept):
+        return None
+    return "\n\n".join(kept)
+
+
+def fit_search_results_to_token_limit(
+    search_results, prompt, source_paragraphs, model_name, token_limit
+):
+    """
+    Decides, in one greedy pass, which scraped content to keep, trim or clear (and which
+    results to drop) so the mega prompt fits the token limit. Every entry and source is
+    tokenized once, so the caller only has to build the final prompt a single time.
+    Returns the kept results, the estimated prompt size, and a list of the changes made.
+    """
+    # NOTE: each entry is counted without its scraped text, the text was counted per paragraph on arrival
+    template_tokens = count_prompt_tokens(create_mega_prompt([], prompt), model_name)
+    entry_tokens = []
+    for entry in search_results:
+        metadata = dict(entry)
+        if entry.get("url") in source_paragraphs:
+            metadata["content"] = None
+        # +2 covers the list separator and the tokens merging across entry boundaries
+        entry_tokens.append(count_prompt_tokens(json.dumps(metadata), model_name) + 2)
+
+    changes = []
+    kept_results = list(search_results)
+    # lowest ranked results go first when even the results without content do not fit
+    while kept_results and template_tokens + sum(entry_tokens) >= token_limit:
+        dropped = kept_results.pop()
+        entry_tokens.pop()
+        changes.append((dropped.get("url"), "dropped", 0, 0))
+
+    source_tokens = {
+        entry["url"]: sum(tokens for _, tokens in source_paragraphs[entry["url"]])
+        for entry in kept_results
+        if entry.get("url") in source_paragraphs
+    }
+    content_budget = token_limit - 1 - template_tokens - sum(entry_tokens)
+    shares = allocate_token_budget(
+        source_tokens, content_budget, config.DEFAULT_SEARCH_MAX_TOKENS_PER_SOURCE
+    )
+
+    estimated_tokens = template_tokens + sum(entry_tokens)
+    for entry in kept_results:
+        url = entry.get("url")
+        if url not in shares:
+            continue
+        if shares[url] < source_tokens[url]:
+            entry["content"] = truncate_to_token_budget(
+                source_paragraphs[url], shares[url]
+            )
+            action = "cleared" if entry["content"] is None else "trimmed"
+            changes.append((url, action, shares[url], source_tokens[url]))
+        estimated_tokens += shares[url]
+
+    return kept_results, estimated_tokens, changes
+
+
 def answer_search(
     client,
     prompt=None,
     big_model=config.DEFAULT_SEARCH_BIG_MODEL,
     small_model=config.DEFAULT_SEARCH_SMALL_MODEL,
     result_count=config.DEFAULT_SEARCH_RESULT_COUNT,
-    time_delay_seconds=config.DEFAULT_SEARCH_TIME_DELAY_SECONDS,
     token_limit=config.DEFAULT_SEARCH_MAX_TOKEN_LIMIT,
     user_input_mode=False,
 ):
@@ -267,6 +426,8 @@ def answer_search(
                     print(colors.blue(">"), line)
                 prompt = editor_content
 
+    utils.warm_token_encoder(big_model)
+
     loading.start_loading("Crafting Queries", "circles")
 
     search_queries = generate_search_queries(client, prompt, small_model)
@@ -279,83 +440,118 @@ def answer_search(
 
     loading.start_loading("Browsing", "circles")
 
-    search_results = []
-    urls = []
-    for query in search_queries:
-        results = search_engine(query, result_count)
-
-        # TODO: this is here to prevent us from surpassing the search engine's query limit
-        time.sleep(time_delay_seconds)
+    video_url_prefixes = tuple(config.VALID_VIDEO_ROOT_URL_DOMAINS_FOR_SCRAPING)
+    # NOTE: a query's urls start scraping as soon as it returns, not after the slowest query
+    scrape_stream = None
+    try:
+        results_per_query = {}
+        submitted_urls = set()
+        for index, results in search_all_queries(search_queries, result_count):
+            if isinstance(results, dict) and "error" in results:
+                continue
+            results_per_query[index] = results
+
+            for result in results:
+                url = result.get("url")
+                # TODO: this solution sucks, but scraping videos can take minutes to process or even lead to a crash
+                if (
+                    not url
+                    or url in submitted_urls
+                    or url.startswith(video_url_prefixes)
+                ):
+                    continue
+                if scrape_stream is None:
+                    scrape_stream = scraper.ScrapeStream(
+                        deadline_seconds=config.SCRAPER_DEADLINE_SECONDS,
+                        main_content=config.DEFAULT_SEARCH_EXTRACT_MAIN_CONTENT,
+                    )
+                scrape_stream.submit(url)
+                submitted_urls.add(url)
 
-        if isinstance(results, dict) and "error" in results:
-            continue
+        # the results keep the order of the queries, not the order they finished in
+        search_results = []
+        urls = []
+        for index in sorted(results_per_query):
+            for result in results_per_query[index]:
+                url = result.get("url")
+                if url and url not in urls:
+                    search_results.append(result)
+                    urls.append(url)
 
-        for result in results:
-            url = result.get("url")
-            if url and not any(existing["url"] == url for existing in search_results):
-                search_results.append(result)
-                urls.append(url)
+        loading.stop_loading()
 
-    loading.stop_loading()
+        not_video_urls = [url for url in urls if url in submitted_urls]
+        if len(not_video_urls) == 0:
+            # TODO: this solution really sucks, we need to build a better solution for this edge case
+            print(colors.red(f"Zero non-video based urls were founded"))
+            return ""
 
-    # TODO: this solution sucks, but scraping videos can take minutes to process or even lead to a crash
-    not_video_urls = [
-        url
-        for url in urls
-        if not url.startswith(tuple(config.VALID_VIDEO_ROOT_URL_DOMAINS_FOR_SCRAPING))
-    ]
-    if len(not_video_urls) == 0:
-        # TODO: this solution really sucks, we need to build a better solution for this edge case
-        print(colors.red(f"Zero non-video based urls were founded"))
-        return ""
-
-    print(colors.red(colors.underline(f"Search Query Results ({len(urls)} Total):")))
-    for url in urls:
-        if url not in not_video_urls:
-            print(colors.yellow(f"x {url}"))
-        else:
-            print(colors.yellow(f"- {url}"))
-
-    print(colors.red(colors.underline("Scraping Website Content:")))
-    loading.start_loading("Scraping", "circles")
-    # TODO: suppress all untrackable print statements by muting all stdout prints
-    with open(os.devnull, "w") as fnull:
-        with redirect_stdout(fnull), redirect_stderr(fnull):
-            scrapped_data = scraper.get_all_htmls(not_video_urls)
-    loading.stop_loading()
+        print(
+            colors.red(colors.underline(f"Search Query Results ({len(urls)} Total):"))
+        )
+        for url in urls:
+            if url not in submitted_urls:
+                print(colors.yellow(f"x {url}"))
+            else:
+                print(colors.yellow(f"- {url}"))
+
+        print(colors.red(colors.underline("Scraping Website Content:")))
+        loading.start_loading("Scraping", "circles")
+        # NOTE: each source is tokenized as soon as it arrives, not after the slowest url finishes
+        scrapped_data = {}
+        source_paragraphs = {}
+        # TODO: suppress all untrackable print statements by muting all stdout prints
+        with open(os.devnull, "w") as fnull:
+            with redirect_stdout(fnull), redirect_stderr(fnull):
+                for url, content in scrape_stream.results():
+                    scrapped_data[url] = content
+                    for entry in search_results:
+                        if url == entry["url"]:
+                            entry["content"] = content
+                    if type(content) == str:
+                        source_paragraphs[url] = count_paragraph_tokens(
+                            content, big_model
+                        )
+        loading.stop_loading()
+    finally:
+        loading.stop_loading()
+        if scrape_stream is not None:
+            scrape_stream.close()
 
-    for url in scrapped_data:
-        for entry in search_results:
-            if url == entry["url"]:
-                entry["content"] = scrapped_data[url]
-    print(colors.yellow(f"Scraped {len(scrapped_data)}/{len(urls)} urls"))
+    scraped_count = sum(1 for content in scrapped_data.values() if content is not None)
+    print(colors.yellow(f"Scraped {scraped_count}/{len(urls)} urls"))
 
-    # TODO: this solution sucks, but it works and prevents us from exceeding the prompt limit
-    mega_prompt = create_mega_prompt(search_results, prompt)
     print(colors.red(colors.underline("Check Final Prompt Limit:")))
-    cleared_urls = []
-    current_prompt_size = utils.count_tokens(mega_prompt, big_model)
-    if current_prompt_size < token_limit:
+
+    search_results, estimated_tokens, changes = fit_search_results_to_token_limit(
+        search_results, prompt, source_paragraphs, big_model, token_limit
+    )
+    for url, action, kept_tokens, total_tokens in changes:
+        if action == "trimmed":
+            print(
+                colors.yellow(
+                    f"Trimmed scraped content for {url} to {kept_tokens}/{total_tokens} tokens"
+                )
+            )
+        elif action == "cleared":
+            print(colors.yellow(f"Cleared scraped content for {url}"))
+        else:
+            print(colors.yellow(f"Dropped search result {url}"))
+
+    if estimated_tokens < token_limit:
         print(
             colors.yellow(
-                f"Final prompt does not exceed model's limit of {token_limit} tokens"
+                f"Final prompt does not exceed model's limit of {token_limit} tokens (~{estimated_tokens})"
             )
         )
     else:
         print(
             colors.yellow(
-                f"Final prompt exceeds model's limit of {token_limit} tokens ({current_prompt_size})"
+                f"Final prompt exceeds model's limit of {token_limit} tokens (~{estimated_tokens})"
             )
         )
-        while utils.count_tokens(mega_prompt, big_model) >= token_limit:
-            for entry in search_results:
-                if type(entry.get("content")) == str:
-                    url = entry.get("url")
-                    entry["content"] = None
-                    cleared_urls.append(url)
-                    mega_prompt = create_mega_prompt(search_results, prompt)
-                    print(colors.yellow(f"Cleared scraped content for {url}"))
-                    break
+
+    mega_prompt = create_mega_prompt(search_results, prompt)
 
     final_output = ""
     try:
@@ -369,17 +565,19 @@ def answer_search(
             stream=True,
         )
 
+        renderer = stream.StreamRenderer(style=colors.green)
         received_first_chunk = False
-        for chunk in response:
-            if chunk.choices[0].delta.content is not None:
-                # stop loading animation after stream starts
-                if not received_first_chunk:
-                    loading.stop_loading()
-                    received_first_chunk = True
-
-                content = chunk.choices[0].delta.content
-                final_output += content
-                print(colors.green(content), end="", flush=True)
+        try:
+            for chunk in response:
+                if chunk.choices[0].delta.content is not None:
+                    # stop loading animation after stream starts
+                    if not received_first_chunk:
+                        loading.stop_loading()
+                        received_first_chunk = True
+
+                    renderer.write(chunk.choices[0].delta.content)
+        finally:
+            final_output = renderer.close()
 
         if final_output.endswith("\n") == False:
             print()
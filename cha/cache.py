@@ -0,0 +1,202 @@
+from urllib.parse import urlparse
+import threading
+import hashlib
+import json
+import time
+
+from cha import utils, config
+
+# NOTE: this module is a best-effort cache, every failure is swallowed so a broken cache never breaks scraping
+_SCRAPE_CACHE_DB_NAME = "scrape_cache.sqlite3"
+
+# entries map a url to a content hash, blobs hold each unique content once
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS scrape_entries (
+        key TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        domain TEXT,
+        content_hash TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scrape_blobs (
+        content_hash TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS scrape_entries_accessed ON scrape_entries(accessed_at)",
+)
+
+_db_lock = threading.Lock()
+_db_connection = None
+
+
+def _get_connection():
+    global _db_connection
+    if _db_connection is None and config.CHA_USE_SCRAPE_CACHE:
+        _db_connection = utils.open_cache_db(_SCRAPE_CACHE_DB_NAME, _SCHEMA)
+    return _db_connection
+
+
+def _url_key(url, variant=None):
+    # NOTE: the variant keeps different extractions (e.g. main content only) of the same url apart
+    key = str(url).strip()
+    if variant:
+        key = f"{variant}:{key}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _url_domain(url):
+    try:
+        domain = urlparse(url).netloc.lower()
+    except ValueError:
+        return ""
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain
+
+
+def ttl_for_url(url):
+    domain = _url_domain(url)
+    for domain_suffix, ttl in config.SCRAPE_CACHE_DOMAIN_TTL_SECONDS.items():
+        if domain == domain_suffix or domain.endswith("." + domain_suffix):
+            return ttl
+    return config.SCRAPE_CACHE_DEFAULT_TTL_SECONDS
+
+
+def lookup_scrape(url, variant=None):
+    """
+    returns the cached entry for a url as a dict, or None on a cache miss.
+    the "fresh" key tells if the entry is still within the url's ttl.
+    """
+    try:
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return None
+
+            row = connection.execute(
+                """
+                SELECT b.content, e.etag, e.last_modified, e.fetched_at
+                FROM scrape_entries e
+                JOIN scrape_blobs b ON b.content_hash = e.content_hash
+                WHERE e.key = ?
+                """,
+                (_url_key(url, variant),),
+            ).fetchone()
+            if row is None:
+                return None
+
+            connection.execute(
+                "UPDATE scrape_entries SET accessed_at = ? WHERE key = ?",
+                (time.time(), _url_key(url, variant)),
+            )
+            connection.commit()
+
+        content, etag, last_modified, fetched_at = row
+        return {
+            "content": json.loads(content),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "fresh": (time.time() - fetched_at) < ttl_for_url(url),
+        }
+    except Exception:
+        return None
+
+
+def mark_scrape_revalidated(url, variant=None):
+    # called when the server answered 304, so the cached content is fresh again
+    try:
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return
+            now = time.time()
+            connection.execute(
+                "UPDATE scrape_entries SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, _url_key(url, variant)),
+            )
+            connection.commit()
+    except Exception:
+        pass
+
+
+def store_scrape(url, content, etag=None, last_modified=None, variant=None):
+    if not content:
+        return
+
+    try:
+        serialized = json.dumps(content)
+        content_hash = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+        now = time.time()
+
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return
+
+            connection.execute(
+                "INSERT OR IGNORE INTO scrape_blobs (content_hash, content, size) VALUES (?, ?, ?)",
+                (content_hash, serialized, len(serialized.encode("utf-8"))),
+            )
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO scrape_entries
+                (key, url, domain, content_hash, etag, last_modified, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    _url_key(url, variant),
+                    url,
+                    _url_domain(url),
+                    content_hash,
+                    etag,
+                    last_modified,
+                    now,
+                    now,
+                ),
+            )
+            _evict_least_recently_used(connection)
+            connection.commit()
+    except Exception:
+        pass
+
+
+def _evict_least_recently_used(connection):
+    # NOTE: the caller must hold _db_lock
+    total_size = connection.execute(
+        "SELECT COALESCE(SUM(size), 0) FROM scrape_blobs"
+    ).fetchone()[0]
+    if total_size <= config.SCRAPE_CACHE_MAX_SIZE_BYTES:
+        return
+
+    rows = connection.execute(
+        """
+        SELECT e.key, b.size
+        FROM scrape_entries e
+        JOIN scrape_blobs b ON b.content_hash = e.content_hash
+        ORDER BY e.accessed_at ASC
+        """
+    ).fetchall()
+
+    keys_to_remove = []
+    for key, size in rows:
+        if total_size <= config.SCRAPE_CACHE_MAX_SIZE_BYTES:
+            break
+        keys_to_remove.append((key,))
+        total_size -= size
+
+    connection.executemany("DELETE FROM scrape_entries WHERE key = ?", keys_to_remove)
+    connection.execute(
+        """
+        DELETE FROM scrape_blobs
+        WHERE content_hash NOT IN (SELECT content_hash FROM scrape_entries)
+        """
+    )
@@ -1,9 +1,11 @@
+from collections import OrderedDict
 import threading
 import importlib
+import time
 import sys
 import os
 
-from cha import colors
+from cha import colors, config
 
 # NOTE: this module is used to lazy load the openai module and warm it up
 _openai_module_instance = None
@@ -47,23 +49,116 @@ def _ensure_openai_module_is_loaded():
     return _openai_module_instance
 
 
+# NOTE: clients are kept per (api key, base url) so switching platforms back and forth keeps their connection pools
+_chat_clients = OrderedDict()
+_chat_clients_lock = threading.Lock()
+_last_prewarm = {}
+
 _current_chat_client_instance = None
+# the api key (and the env variable it came from) and base url of the current client, None means the openai default
+_current_chat_client_settings = {"api_key": None, "api_key_env": None, "base_url": None}
+
+
+def _new_chat_client(api_key, base_url):
+    openai_mod = _ensure_openai_module_is_loaded()
+    http_client = None
+    try:
+        import httpx
+
+        # NOTE: httpx drops idle connections after 5s by default, too soon to survive the user typing
+        http_client = openai_mod.DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=1000,
+                max_keepalive_connections=100,
+                keepalive_expiry=config.CHA_CLIENT_KEEPALIVE_SECONDS,
+            )
+        )
+    except Exception:
+        pass
+    return openai_mod.OpenAI(
+        api_key=api_key, base_url=base_url, http_client=http_client
+    )
+
+
+def get_chat_client(api_key=None, base_url=None):
+    """
+    Returns the client for an api key and base url (None means the openai
+    default), creating it on first use. The CHA_CLIENT_CACHE_SIZE most recently
+    used clients are kept with their connection pools, older ones are dropped.
+    """
+    if api_key is None:
+        api_key = os.environ.get("OPENAI_API_KEY")
+    key = (api_key, base_url)
+    with _chat_clients_lock:
+        client = _chat_clients.get(key)
+        if client is None:
+            client = _new_chat_client(api_key, base_url)
+            _chat_clients[key] = client
+        _chat_clients.move_to_end(key)
+        while len(_chat_clients) > max(config.CHA_CLIENT_CACHE_SIZE, 1):
+            # NOTE: not closed, a request that still uses it keeps it alive until it is done
+            dropped_key, _ = _chat_clients.popitem(last=False)
+            _last_prewarm.pop(dropped_key, None)
+    return client
 
 
 def get_current_chat_client():
     global _current_chat_client_instance
     if _current_chat_client_instance is None:
-        openai_mod = _ensure_openai_module_is_loaded()
-        _current_chat_client_instance = openai_mod.OpenAI(
-            api_key=os.environ.get("OPENAI_API_KEY")
-        )
+        _current_chat_client_instance = get_chat_client()
     return _current_chat_client_instance
 
 
-def set_current_chat_client(api_key, base_url):
-    global _current_chat_client_instance
-    openai_mod = _ensure_openai_module_is_loaded()
-    _current_chat_client_instance = openai_mod.OpenAI(
-        api_key=api_key, base_url=base_url
-    )
+def set_current_chat_client(api_key, base_url, api_key_env=None):
+    global _current_chat_client_instance, _current_chat_client_settings
+    _current_chat_client_instance = get_chat_client(api_key, base_url)
+    _current_chat_client_settings = {
+        "api_key": api_key,
+        "api_key_env": api_key_env,
+        "base_url": base_url,
+    }
     return _current_chat_client_instance
+
+
+def resolve_api_key(api_key_env=None):
+    # the value of the env variable, a name that is not set is the key itself (e.g. "ollama")
+    if api_key_env is None:
+        return os.environ.get("OPENAI_API_KEY")
+    return os.environ.get(api_key_env, api_key_env)
+
+
+def get_current_chat_client_settings():
+    # what a cha --daemon needs to build the same client, only the key's env name, never the key itself
+    return {
+        "api_key_env": _current_chat_client_settings["api_key_env"],
+        "base_url": _current_chat_client_settings["base_url"],
+    }
+
+
+def _prewarm_func(settings):
+    try:
+        client = get_chat_client(settings["api_key"], settings["base_url"])
+        # any response will do, the point is the pooled tcp/tls connection to the base url
+        client._client.head(str(client.base_url), timeout=5)
+    except Exception:
+        pass
+
+
+def prewarm_current_chat_client():
+    """
+    Opens a connection to the current platform's base url in the background (e.g.
+    while the user types), at most once per CHA_CLIENT_KEEPALIVE_SECONDS / 2 for
+    each client, so the next request does not wait for the tcp/tls handshake.
+    """
+    settings = dict(_current_chat_client_settings)
+    if settings["api_key"] is None:
+        settings["api_key"] = os.environ.get("OPENAI_API_KEY")
+    key = (settings["api_key"], settings["base_url"])
+    now = time.monotonic()
+    if (
+        now - _last_prewarm.get(key, float("-inf"))
+        < config.CHA_CLIENT_KEEPALIVE_SECONDS / 2
+    ):
+        return
+    _last_prewarm[key] = now
+    threading.Thread(target=_prewarm_func, args=(settings,), daemon=True).start()
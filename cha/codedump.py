@@ -1,12 +1,15 @@
 from datetime import datetime
+from itertools import islice
+import concurrent.futures
+import collections
 import subprocess
 import fnmatch
 import time
 import sys
+import re
 import os
 
-from cha import colors, utils, config
-import pathspec
+from cha import colors, utils, config, codeindex, walk
 
 
 def is_probably_binary_by_extension(file_path):
@@ -14,31 +17,102 @@ def is_probably_binary_by_extension(file_path):
     return ext in config.BINARY_EXTENSIONS
 
 
-def is_binary_file_by_sniff(file_path, num_bytes=1024):
+def sniff_text_file(file_path, max_size_bytes=None, num_bytes=1024):
+    # returns "text", "binary", or "too_large" using a stat and a single small read
+    if is_probably_binary_by_extension(file_path):
+        return "binary"
     try:
+        if max_size_bytes is not None and os.path.getsize(file_path) > max_size_bytes:
+            return "too_large"
         with open(file_path, "rb") as f:
             chunk = f.read(num_bytes)
-            if b"\x00" in chunk:
-                return True
     except:
-        return True
-    return False
-
-
-def is_text_file(file_path):
-    if is_probably_binary_by_extension(file_path):
-        return False
-    if is_binary_file_by_sniff(file_path):
-        return False
-    return True
+        return "binary"
+    if b"\x00" in chunk:
+        return "binary"
+    return "text"
 
 
-def read_file(file_path):
+def read_text_file(file_path, num_bytes=1024):
+    # sniffs and reads the file in one open, returns None if it turned out to be binary
     try:
-        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
-            return f.read()
+        with open(file_path, "rb") as f:
+            data = f.read()
     except:
         return None
+    if b"\x00" in data[:num_bytes]:
+        return None
+    text = data.decode("utf-8", errors="replace")
+    # NOTE: same newline handling as reading the file in text mode
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def scan_text_files(file_paths, max_workers=None, root_path=None, index=None):
+    """
+    Sniffs every file on a thread pool without reading the full bodies. Returns the
+    text files (in the given order) and the files skipped for being over the size limit.
+    If an index (see codeindex.py) is given, files whose mtime and size did not change
+    are not opened at all, and the index entries are updated in place.
+    """
+    max_workers = max_workers or config.CODEDUMP_MAX_WORKERS
+    max_size_bytes = config.CODEDUMP_MAX_FILE_SIZE_BYTES
+
+    def scan(file_path):
+        try:
+            stat_result = os.stat(file_path)
+        except:
+            return "binary", None
+        if stat_result.st_size > max_size_bytes:
+            return "too_large", stat_result
+        if index is not None:
+            entry = index.get(os.path.relpath(file_path, root_path))
+            if codeindex.is_unchanged(entry, stat_result):
+                return ("binary" if entry.get("binary") else "text"), stat_result
+        return sniff_text_file(file_path), stat_result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(scan, file_paths))
+
+    text_files, too_large_files = [], []
+    for file_path, (kind, stat_result) in zip(file_paths, results):
+        if kind == "text":
+            text_files.append(file_path)
+        elif kind == "too_large":
+            too_large_files.append(file_path)
+
+        if index is not None and stat_result is not None and kind != "too_large":
+            rel_path = os.path.relpath(file_path, root_path)
+            if not codeindex.is_unchanged(index.get(rel_path), stat_result):
+                index[rel_path] = {
+                    "mtime_ns": stat_result.st_mtime_ns,
+                    "size": stat_result.st_size,
+                    "binary": kind == "binary",
+                    # NOTE: the token count is still reused later if the content hash matches
+                    "hash": index.get(rel_path, {}).get("hash"),
+                    "tokens": index.get(rel_path, {}).get("tokens"),
+                    "token_model": index.get(rel_path, {}).get("token_model"),
+                }
+    return text_files, too_large_files
+
+
+def iter_file_contents(file_paths, max_workers=None):
+    """
+    Reads files on a thread pool but yields (path, content) in the given order, only
+    ever reading a small window ahead so every file body is never held at once.
+    """
+    max_workers = max_workers or config.CODEDUMP_MAX_WORKERS
+    file_paths = iter(file_paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque(
+            (file_path, executor.submit(read_text_file, file_path))
+            for file_path in islice(file_paths, max_workers * 2)
+        )
+        while pending:
+            file_path, future = pending.popleft()
+            next_path = next(file_paths, None)
+            if next_path is not None:
+                pending.append((next_path, executor.submit(read_text_file, next_path)))
+            yield file_path, future.result()
 
 
 def get_git_tracked_and_untracked_files(repo_path):
@@ -57,71 +131,67 @@ def get_git_tracked_and_untracked_files(repo_path):
         return []
 
 
-def load_gitignore_patterns(dir_path):
-    if not pathspec:
-        return None
-    gitignore_path = os.path.join(dir_path, ".gitignore")
-    if not os.path.isfile(gitignore_path):
-        return None
-    try:
-        with open(gitignore_path, "r", encoding="utf-8") as f:
-            ignore_lines = f.read().splitlines()
-        return pathspec.PathSpec.from_lines("gitwildmatch", ignore_lines)
-    except:
-        return None
-
-
 def get_all_files_with_ignore(dir_path):
-    spec = load_gitignore_patterns(dir_path)
-    all_paths = []
-    for root, dirs, files in os.walk(dir_path):
-        for filename in files:
-            full_path = os.path.join(root, filename)
-            rel_path = os.path.relpath(full_path, dir_path)
-            if spec and spec.match_file(rel_path):
+    # NOTE: ignored directories and everything matched by any (nested) .gitignore are never descended into
+    return [
+        entry.rel_path
+        for entry in walk.walk_files(
+            dir_path, use_gitignore=True, max_workers=config.CODEDUMP_MAX_WORKERS
+        )
+    ]
+
+
+class IncludeMatcher:
+    """
+    The specific include patterns compiled once. Literal paths go into a trie of path
+    components (exact files, directories, and every parent directory) and all globs
+    into one regex that matches the path or any of its parent directories, so each
+    check costs about one pass over the path instead of a loop per pattern and parent.
+    """
+
+    def __init__(self, root_path, specific_includes):
+        self.trie = {}
+        globs = []
+        for include_pattern in specific_includes or []:
+            include_pattern = include_pattern.strip()
+            if not include_pattern:
                 continue
-            all_paths.append(rel_path)
-    return all_paths
-
 
-def matches_specific_includes(file_path, root_path, specific_includes):
-    if not specific_includes:
-        return False
-
-    rel_path = os.path.relpath(file_path, root_path)
-
-    for include_pattern in specific_includes:
-        include_pattern = include_pattern.strip()
-        if not include_pattern:
-            continue
-
-        # handle directory includes (add trailing slash if needed)
-        if os.path.isdir(os.path.join(root_path, include_pattern)):
-            if not include_pattern.endswith("/"):
-                include_pattern += "/"
-
-        # check exact match
-        if rel_path == include_pattern or rel_path == include_pattern.rstrip("/"):
-            return True
-
-        # check if file is under a directory pattern
-        if include_pattern.endswith("/") and rel_path.startswith(include_pattern):
-            return True
-
-        # check glob pattern match
-        if fnmatch.fnmatch(rel_path, include_pattern):
-            return True
-
-        # check if any parent directory matches the pattern
-        parent_path = os.path.dirname(rel_path)
-        while parent_path:
-            if fnmatch.fnmatch(
-                parent_path, include_pattern
-            ) or parent_path == include_pattern.rstrip("/"):
+            # handle directory includes (add trailing slash if needed)
+            if os.path.isdir(os.path.join(root_path, include_pattern)):
+                if not include_pattern.endswith("/"):
+                    include_pattern += "/"
+
+            literal = include_pattern.rstrip("/")
+            if literal:
+                node = self.trie
+                for part in literal.split("/"):
+                    node = node.setdefault(part, {})
+                # NOTE: matches the path itself or anything under it
+                node[None] = True
+
+            # the glob may match the path itself or one of its parent directories
+            translated = fnmatch.translate(os.path.normcase(include_pattern))
+            if translated.endswith(r"\Z"):
+                translated = translated[: -len(r"\Z")]
+            globs.append(translated)
+
+        self.glob_regex = None
+        if globs:
+            self.glob_regex = re.compile("(?:" + "|".join(globs) + r")(?=/|\Z)")
+
+    def matches(self, rel_path):
+        node = self.trie
+        for part in rel_path.split("/"):
+            node = node.get(part)
+            if node is None:
+                break
+            if None in node:
                 return True
-            parent_path = os.path.dirname(parent_path)
 
-    return False
+        if self.glob_regex is not None:
+            return self.glob_regex.match(os.path.normcase(rel_path)) is not None
+        return False
 
 
 def interactive_selection(root_path, files_dict, include_mode=False):
@@ -302,18 +372,95 @@ def interactive_selection(root_path, files_dict, include_mode=False):
     return selected
 
 
-def get_tree_output(dir_path):
-    try:
-        cmd = ["tree", "--gitignore", "--prune", dir_path]
-        result = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
-        )
-        return result.stdout
-    except:
-        return "Failed to generate tree output"
+def _build_file_tree(rel_paths):
+    # nested dicts of directory names, files are the leaves (None)
+    tree = {}
+    for rel_path in rel_paths:
+        parts = rel_path.replace(os.sep, "/").strip("/").split("/")
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is None:
+                child = node[part] = {}
+            node = child
+        node.setdefault(parts[-1], None)
+    return tree
+
+
+def get_tree_output(root_path, rel_paths, included_rel_paths=None):
+    """
+    Renders a `tree` style view of the already collected rel_paths in process, so
+    no second walk or `tree` subprocess is needed. Files missing from
+    included_rel_paths are marked as excluded, and directories without any included
+    file that hold more than CODEDUMP_TREE_COLLAPSE_THRESHOLD files are collapsed.
+    """
+    included = None
+    if included_rel_paths is not None:
+        included = {rel.replace(os.sep, "/") for rel in included_rel_paths}
+    tree = _build_file_tree(rel_paths)
+
+    # count the (included) files under every directory once, bottom up
+    dir_stats = {}
+
+    def collect_stats(node, rel_dir):
+        total, total_included = 0, 0
+        for name, child in node.items():
+            if child is None:
+                total += 1
+                if included is None or f"{rel_dir}{name}" in included:
+                    total_included += 1
+            else:
+                child_total, child_included = collect_stats(child, f"{rel_dir}{name}/")
+                total += child_total
+                total_included += child_included
+        dir_stats[id(node)] = (total, total_included)
+        return total, total_included
+
+    collect_stats(tree, "")
+
+    lines = [root_path]
+    counts = {"dirs": 0, "files": 0}
+
+    def render(node, rel_dir, indent):
+        names = sorted(node, key=lambda name: (name.lower(), name))
+        for i, name in enumerate(names):
+            is_last = i == len(names) - 1
+            branch = "└── " if is_last else "├── "
+            child_indent = indent + ("    " if is_last else "│   ")
+            child = node[name]
+
+            if child is None:
+                counts["files"] += 1
+                mark = ""
+                if included is not None and f"{rel_dir}{name}" not in included:
+                    mark = " (excluded)"
+                lines.append(f"{indent}{branch}{name}{mark}")
+                continue
+
+            counts["dirs"] += 1
+            total, total_included = dir_stats[id(child)]
+            if (
+                included is not None
+                and total_included == 0
+                and total > config.CODEDUMP_TREE_COLLAPSE_THRESHOLD
+            ):
+                counts["files"] += total
+                lines.append(f"{indent}{branch}{name}/ ({total} files, all excluded)")
+                continue
+
+            lines.append(f"{indent}{branch}{name}")
+            render(child, f"{rel_dir}{name}/", child_indent)
+
+    render(tree, "", "")
+
+    dir_label = "directory" if counts["dirs"] == 1 else "directories"
+    file_label = "file" if counts["files"] == 1 else "files"
+    lines.append("")
+    lines.append(f"{counts['dirs']} {dir_label}, {counts['files']} {file_label}")
+    return "\n".join(lines) + "\n"
 
 
-def generate_text_output(root_path, files_dict, selected_files, include_mode=False):
+def get_included_files(files_dict, selected_files, include_mode=False):
     if include_mode:
         included = [f for f in files_dict if f in selected_files]
         # check for empty selection in include mode
@@ -322,9 +469,15 @@ def generate_text_output(root_path, files_dict, selected_files, include_mode=Fal
             return None
     else:
         included = [f for f in files_dict if f not in selected_files]
+    return included
 
+
+def build_header(root_path, included, rel_paths=None):
     utc_now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-    tree_output = get_tree_output(root_path)
+    included_rel_paths = [os.path.relpath(f, root_path) for f in included]
+    if rel_paths is None:
+        rel_paths = included_rel_paths
+    tree_output = get_tree_output(root_path, rel_paths, included_rel_paths)
     epoch_time = time.time()
     header = (
         "GENERAL INFORMATION/DATA:\n"
@@ -342,10 +495,14 @@ def generate_text_output(root_path, files_dict, selected_files, include_mode=Fal
     header += "\nDIRECTORY STRUCTURE (TREE OUTPUT):\n`````\n"
     header += tree_output
     header += "`````\n"
+    return header
+
 
-    body = []
-    for f in included:
-        content = files_dict[f]
+def iter_file_sections(root_path, included):
+    # yields (short_path, content, section) for each readable file, in order
+    for f, content in iter_file_contents(included):
+        if content is None:
+            continue
         short_path = os.path.relpath(f, root_path)
         section = (
             f"\nFILE PATH: {short_path}\n"
@@ -354,13 +511,35 @@ def generate_text_output(root_path, files_dict, selected_files, include_mode=Fal
             f"{content}\n"
             "`````\n"
         )
-        body.append(section)
-    return header + "".join(body)
+        yield short_path, content, section
+
+
+def _count_pending_sections(token_count, pending, model_name):
+    if not pending:
+        return token_count
+    counts = utils.count_tokens_batch([section for _, section in pending], model_name)
+    for (entry, _), count in zip(pending, counts):
+        if count is not None:
+            entry["tokens"] = count
+            entry["token_model"] = model_name
+    if token_count is None or None in counts:
+        return None
+    return token_count + sum(counts)
 
 
 def extract_code(
-    dir_path, include_mode=False, auto_include_all=False, specific_includes=None
+    dir_path,
+    include_mode=False,
+    auto_include_all=False,
+    specific_includes=None,
+    output=None,
 ):
+    """
+    Builds the dump of the selected files, returns (text, token_count) or (None, 0)
+    if nothing was selected. With output (a writable text file) each section is
+    written to it as soon as its file is read and "" is returned as the text, so
+    at most one token counting batch of file bodies is in memory at once.
+    """
     root_path = os.path.abspath(dir_path)
     if os.path.isdir(os.path.join(root_path, ".git")):
         rel_paths = get_git_tracked_and_untracked_files(root_path)
@@ -369,43 +548,80 @@ def extract_code(
     if not rel_paths:
         print(colors.red("No files found!"))
         return None, 0
-    files_dict = {}
-    for rel in rel_paths:
-        abs_path = os.path.join(root_path, rel)
-        if is_text_file(abs_path):
-            content = read_file(abs_path)
-            if content is not None:
-                files_dict[abs_path] = content
+    abs_paths = [os.path.join(root_path, rel) for rel in rel_paths]
+    if specific_includes:
+        # NOTE: match the include patterns first so files that were never asked for are never opened
+        include_matcher = IncludeMatcher(root_path, specific_includes)
+        abs_paths = [
+            abs_path
+            for abs_path, rel in zip(abs_paths, rel_paths)
+            if include_matcher.matches(rel)
+        ]
+        if not abs_paths:
+            print(colors.red("No files matched the specified include patterns!"))
+            return None, 0
+
+    index = codeindex.load_index(root_path)
+    text_files, too_large_files = scan_text_files(
+        abs_paths, root_path=root_path, index=index
+    )
+    if too_large_files:
+        print(
+            colors.yellow(
+                f"Skipped {len(too_large_files)} file(s) larger than {config.CODEDUMP_MAX_FILE_SIZE_BYTES} bytes"
+            )
+        )
+    # NOTE: only the keys (the file list) are used, file bodies are read while the output is generated
+    files_dict = dict.fromkeys(text_files)
     if not files_dict:
+        codeindex.save_index(root_path, index, rel_paths)
         print(colors.red("No text files found!"))
         return None, 0
 
-    if specific_includes:
-        # use specific includes mode
-        selected_files = set()
-        for file_path in files_dict.keys():
-            if matches_specific_includes(file_path, root_path, specific_includes):
-                selected_files.add(file_path)
-
-        if not selected_files:
-            print(colors.red("No files matched the specified include patterns!"))
-            return None, 0
-    elif auto_include_all:
+    if specific_includes or auto_include_all:
         selected_files = set(files_dict.keys())
     else:
         selected_files = interactive_selection(root_path, files_dict, include_mode)
         if selected_files is None:
+            codeindex.save_index(root_path, index, rel_paths)
             return None, 0
 
-    output_text = generate_text_output(
-        root_path, files_dict, selected_files, include_mode
-    )
-    if output_text is None:
+    included = get_included_files(files_dict, selected_files, include_mode)
+    if included is None:
+        codeindex.save_index(root_path, index, rel_paths)
         return None, 0
 
-    token_count = utils.count_tokens(
-        output_text, config.DEFAULT_SEARCH_BIG_MODEL, False
-    )
+    model_name = config.DEFAULT_SEARCH_BIG_MODEL
+    header = build_header(root_path, included, rel_paths)
+    output_chunks = []
+    write = output.write if output is not None else output_chunks.append
+    write(header)
+    token_count = utils.count_tokens(header, model_name)
+
+    # NOTE: tokens of unchanged files come from the index, the rest are counted in batches while reading
+    pending = []
+    for short_path, content, section in iter_file_sections(root_path, included):
+        write(section)
+        entry = index.setdefault(short_path, {})
+        digest = codeindex.content_hash(content)
+        if (
+            entry.get("hash") == digest
+            and entry.get("token_model") == model_name
+            and entry.get("tokens") is not None
+        ):
+            if token_count is not None:
+                token_count += entry["tokens"]
+            continue
+
+        entry.update({"hash": digest, "tokens": None, "token_model": None})
+        pending.append((entry, section))
+        if len(pending) >= 64:
+            token_count = _count_pending_sections(token_count, pending, model_name)
+            pending = []
+    token_count = _count_pending_sections(token_count, pending, model_name)
+    output_text = "".join(output_chunks)
+
+    codeindex.save_index(root_path, index, rel_paths)
 
     return output_text, token_count
 
@@ -417,7 +633,16 @@ def code_dump(
     output_to_stdout=False,
     specific_includes=None,
     quiet=False,
+    output=None,
 ):
+    """
+    Dumps the files of a directory, returns (content, token_count). When saved to a
+    file, or written to output (a writable text file) as it is generated, the
+    content is not kept and None is returned in its place.
+    """
+    # the encoder loads while the user is still picking files
+    utils.warm_token_encoder(config.DEFAULT_SEARCH_BIG_MODEL)
+
     try:
         dir_path = os.getcwd()
         if dir_full_path != None:
@@ -451,8 +676,23 @@ def code_dump(
             else:
                 include_mode = selected_mode == "Include"
 
+        if save_file_to_current_dir and not output_to_stdout:
+            file_name = f"code_dump_{int(time.time())}.txt"
+            with open(file_name, "w", encoding="utf-8") as file:
+                content, token_count = extract_code(
+                    dir_path, include_mode, auto_include_all, specific_includes, file
+                )
+            if content is None:
+                os.remove(file_name)
+                return None, 0
+            if not quiet:
+                print(colors.yellow(f"{dir_path}"))
+                print(colors.magenta(f"{token_count} Total Tokens"))
+            print(colors.green(f"Exported to {file_name}"))
+            return None, token_count
+
         content, token_count = extract_code(
-            dir_path, include_mode, auto_include_all, specific_includes
+            dir_path, include_mode, auto_include_all, specific_includes, output
         )
 
         if content is None:
@@ -462,16 +702,12 @@ def code_dump(
             print(colors.yellow(f"{dir_path}"))
             print(colors.magenta(f"{token_count} Total Tokens"))
 
+        if output is not None:
+            return None, token_count
+
         if output_to_stdout:
             return content, token_count
 
-        if save_file_to_current_dir:
-            file_name = f"code_dump_{int(time.time())}.txt"
-            with open(file_name, "w") as file:
-                file.write(content)
-            print(colors.green(f"Exported to {file_name}"))
-            return None, token_count
-
         return (
             utils.rls(
                 text=f"""
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+
+from cha import utils, config
+
+# NOTE: a per-repo index so repeated code dumps skip unchanged files, without it every file is read again
+_INDEX_VERSION = 1
+
+
+def _index_path(root_path):
+    name = hashlib.sha256(os.path.abspath(root_path).encode("utf-8")).hexdigest()
+    return os.path.join(
+        config.LOCAL_CHA_CONFIG_CACHE_DIR, "codedump", f"{name[:32]}.json"
+    )
+
+
+def _is_enabled():
+    return utils.local_cache_enabled(config.CHA_USE_CODEDUMP_INDEX)
+
+
+def load_index(root_path):
+    """
+    returns the saved entries for a repo as {rel_path: entry}, each entry holding the
+    file's mtime_ns, size, binary flag, and (for text files) content hash and token count.
+    """
+    if not _is_enabled():
+        return {}
+    try:
+        with open(_index_path(root_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != _INDEX_VERSION or data.get("root") != root_path:
+            return {}
+        return data.get("files", {})
+    except Exception:
+        return {}
+
+
+def save_index(root_path, entries, rel_paths):
+    if not _is_enabled():
+        return
+    try:
+        # files that git (or the walk) no longer lists are dropped from the index
+        rel_paths = set(rel_paths)
+        entries = {rel: entry for rel, entry in entries.items() if rel in rel_paths}
+
+        index_path = _index_path(root_path)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        utils.write_json_atomic(
+            index_path,
+            {"version": _INDEX_VERSION, "root": root_path, "files": entries},
+        )
+    except Exception:
+        pass
+
+
+def is_unchanged(entry, stat_result):
+    return (
+        entry is not None
+        and entry.get("mtime_ns") == stat_result.st_mtime_ns
+        and entry.get("size") == stat_result.st_size
+    )
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8", errors="replace")).hexdigest()
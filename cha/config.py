@@ -1,10 +1,10 @@
 # NOTE: do NOT modify any of the "import" lines below, just the variables!
 from pathlib import Path
 import importlib.util
+import marshal
+import sys
 import os
 
-from cha import local
-
 
 def lazy_tool(module_path, class_name):
     return {"_lazy_tool": True, "module_path": module_path, "class_name": class_name}
@@ -79,13 +79,60 @@ CHA_DEFAULT_MODEL = "gpt-4.1"
 CHA_DEFAULT_IMAGE_MODEL = "gpt-4o"
 CHA_DEBUG_MODE = False
 CHA_STREAMING_ERROR_LIMIT = 5
+# print the reasoning deltas of models whose platform streams them (e.g. deepseek-reasoner)
+CHA_SHOW_REASONING = True
 CHA_CURRENT_PLATFORM_NAME = "openai"
 
 # local config variables
 CHA_DEFAULT_SHOW_PRINT_TITLE = True
 CHA_LOCAL_SAVE_ALL_CHA_CHATS = False
+# finished turns are journaled right away, fsync is batched to at most once per this many seconds
+CHA_HISTORY_JOURNAL_FSYNC_SECONDS = 2
 CHA_SHOW_VISITED_DIRECTORIES_ON_EXIT = True
 
+# chat context window config, the policy is one of "drop", "trim", "summarize", or "off"
+CHA_CONTEXT_POLICY = "summarize"
+CHA_CONTEXT_SUMMARY_MODEL = "gpt-4.1-mini"
+CHA_CONTEXT_SUMMARY_MAX_TOKENS = 2_000
+CHA_CONTEXT_RESERVED_TOKENS = 8_000
+CHA_CONTEXT_TRIM_KEEP_TOKENS = 1_000
+CHA_CONTEXT_DEFAULT_WINDOW = 128_000
+# a chat estimated below this share of the budget is sent as is, only a bigger one is counted with tiktoken
+CHA_CONTEXT_ESTIMATE_MARGIN = 0.5
+# context window sizes in tokens, the first pattern that matches the model name wins
+MODEL_CONTEXT_WINDOWS = {
+    r"^gpt-4\.1": 1_047_576,
+    r"^gpt-5": 400_000,
+    r"^gpt-4o": 128_000,
+    r"^gpt-4-turbo": 128_000,
+    r"^gpt-4": 8_192,
+    r"^gpt-3\.5": 16_385,
+    r"^o\d+": 200_000,
+    r"^claude": 200_000,
+    r"^gemini": 1_048_576,
+    r"^grok-4": 256_000,
+    r"^grok": 131_072,
+    r"^deepseek": 128_000,
+}
+# keep code dumps and loaded files at a stable prefix so provider side prompt caching can hit
+CHA_PROMPT_CACHE_MODE = False
+# models that need an explicit anthropic style cache_control breakpoint (regex)
+CHA_PROMPT_CACHE_CONTROL_MODELS = [r"claude"]
+# print the prompt (cached/uncached) and completion tokens plus the latency of every answer
+CHA_SHOW_TURN_USAGE = False
+
+# cha --daemon config, while a daemon runs one-shot chats (e.g. cha "question" or git diff | cha) go through it
+CHA_USE_DAEMON = True
+# None means $XDG_RUNTIME_DIR (or the temp dir)/cha-<uid>/daemon.sock
+CHA_DAEMON_SOCKET_PATH = None
+CHA_DAEMON_CONNECT_TIMEOUT_SECONDS = 0.5
+
+# openai clients config, the most recently used clients (one per api key and base url) are kept with their connections
+CHA_CLIENT_CACHE_SIZE = 4
+CHA_CLIENT_KEEPALIVE_SECONDS = 60
+# open a connection to the current platform in the background while the user types
+CHA_PREWARM_CONNECTIONS = True
+
 # shell command security config, block only very dangerous commands
 BLOCKED_SHELL_COMMANDS = [
     "sudo",
@@ -125,17 +172,24 @@ DEFAULT_SEARCH_BIG_MODEL = "gpt-4.1"
 DEFAULT_SEARCH_SMALL_MODEL = "gpt-4.1-mini"
 DEFAULT_SEARCH_FRESHNESS_STATE = "none"
 DEFAULT_SEARCH_MAX_TOKEN_LIMIT = 1_000_000
-DEFAULT_SEARCH_TIME_DELAY_SECONDS = 1
 DEFAULT_SEARCH_RESULT_COUNT = 5
+DEFAULT_SEARCH_EXTRACT_MAIN_CONTENT = True
+DEFAULT_SEARCH_MAX_TOKENS_PER_SOURCE = 25_000
 DEFAULT_GEN_SEARCH_QUERY_COUNT = 5
 CHA_SEAR_XNG_BASE_URL = "http://localhost:8080"
 CHA_USE_SEAR_XNG = False
 CHA_SEAR_XNG_TIMEOUT = 30
+# how many of the generated search queries run at once
+CHA_SEARCH_MAX_CONCURRENCY = 5
+# per search backend token bucket as (queries per second, burst), None means no limit
+CHA_SEARCH_RATE_LIMITS = {"searxng": None, "ddgs": (1, 1)}
 
 # other random configs
 OPENAI_MODELS_TO_KEEP = ["gpt", "o0", "o1", "o2", "o3", "o4", "o5", "o6", "o7"]
 OPENAI_IGNORE_DATED_MODEL_NAMES = False
 BY_PASS_SLOW_MODEL_DETECTION = False
+# load the tiktoken encoder in a background thread before it is first needed
+CHA_WARM_TOKEN_ENCODER = True
 OPENAI_MODELS_TO_IGNORE = [
     "instruct",
     "realtime",
@@ -151,6 +205,9 @@ PREFERRED_TERMINAL_IDE = "vi"
 MOVE_CURSOR_ONE_LINE = "\033[F"
 HIDE_CURSOR = "\033[?25l"
 SHOW_CURSOR = "\033[?25h"
+# streamed answers are printed in batches, at most this far apart or once this many characters are buffered
+STREAM_FLUSH_INTERVAL_SECONDS = 0.016
+STREAM_FLUSH_BYTES = 4096
 CLEAR_LINE = "\033[K"
 TERMINAL_THEME_CODES = {
     "reset": "\033[0m",
@@ -184,13 +241,66 @@ EXTERNAL_TOOLS = []
 REQUEST_DEFAULT_TIMEOUT_SECONDS = 10
 REQUEST_DEFAULT_RETRY_COUNT = 1
 REQUEST_BACKOFF_FACTOR = 0.1
+# pooled http session configs (connections are kept alive and reused across requests)
+REQUEST_POOL_HOST_COUNT = 32
+REQUEST_POOL_MAX_CONNECTIONS_PER_HOST = 8
+REQUEST_POOL_BLOCK_WHEN_FULL = True
 REQUEST_DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
+# scraper cache configs (stored in ~/.cha/cache/, only used if ~/.cha/ exists)
+CHA_USE_SCRAPE_CACHE = True
+SCRAPE_CACHE_DEFAULT_TTL_SECONDS = 60 * 60
+SCRAPE_CACHE_MAX_SIZE_BYTES = 200 * 1024 * 1024
+SCRAPE_CACHE_DOMAIN_TTL_SECONDS = {
+    "youtube.com": 7 * 24 * 60 * 60,
+    "arxiv.org": 7 * 24 * 60 * 60,
+    "wikipedia.org": 24 * 60 * 60,
+}
+
+# model catalog cache for !m and !p (stored in ~/.cha/cache/models/, only used if ~/.cha/ exists), it also remembers
+# which models refused a streamed request
+CHA_USE_MODEL_CATALOG_CACHE = True
+# an older catalog is still shown right away but refreshed in the background for the next time
+CHA_MODEL_CATALOG_TTL_SECONDS = 24 * 60 * 60
+# platforms served from this machine (e.g. ollama) get models on every pull, their catalog is older than this after any
+# pull, so it is refetched on open (a fast local call) and the cached one is only used if the platform is not running
+CHA_LOCAL_MODEL_CATALOG_TTL_SECONDS = 0
+
+# history search index (stored in ~/.cha/cache/, only used if ~/.cha/ exists)
+CHA_USE_HISTORY_INDEX = True
+CHA_HISTORY_INDEX_MAX_FIELD_CHARS = 100_000
+# at most this many turns are shown in fzf per search, each with a preview of this many characters
+CHA_HISTORY_SEARCH_LIMIT = 2_000
+CHA_HISTORY_PREVIEW_CHARS = 4_000
+
+# scraper concurrency configs, the deadline only applies to the web search features (None always waits for every url)
+SCRAPER_MAX_CONCURRENCY = 16
+SCRAPER_MAX_CONCURRENCY_PER_HOST = 4
+SCRAPER_DEADLINE_SECONDS = 45
+
+# html to text backend for scraped pages: "auto" (lxml if installed, else "stdlib"), "lxml", "stdlib", or "bs4"
+SCRAPER_HTML_EXTRACTOR = "auto"
+SCRAPER_HTML_IGNORED_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "nav",
+    "footer",
+]
+
 # codedump variables
 NOTHING_SELECTED_TAG = "[NOTHING]"
 EXIT_SELECTION_TAG = "[EXIT]"
+CODEDUMP_MAX_FILE_SIZE_BYTES = 2 * 1024 * 1024
+CODEDUMP_MAX_WORKERS = 16
+# directories in the dump's tree with no included files and more files than this are collapsed
+CODEDUMP_TREE_COLLAPSE_THRESHOLD = 25
+# keep a per-repo index of file sizes, mtimes, and token counts in ~/.cha/cache/codedump/
+CHA_USE_CODEDUMP_INDEX = True
 FILES_TO_IGNORE = [
     ".DS_Store",
     ".env",
@@ -824,6 +934,7 @@ TOOL_MOST_HAVE_VARIABLES = {
 LOCAL_CHA_CONFIG_DIR = os.path.join(str(Path.home()), ".cha/")
 LOCAL_CHA_CONFIG_HISTORY_DIR = os.path.join(LOCAL_CHA_CONFIG_DIR, "history/")
 LOCAL_CHA_CONFIG_TOOLS_DIR = os.path.join(LOCAL_CHA_CONFIG_DIR, "tools/")
+LOCAL_CHA_CONFIG_CACHE_DIR = os.path.join(LOCAL_CHA_CONFIG_DIR, "cache/")
 LOCAL_CHA_CONFIG_FILE = os.path.join(LOCAL_CHA_CONFIG_DIR, "config.py")
 
 _external_config_loaded = False
@@ -859,10 +970,101 @@ def get_external_tools_execute():
     _load_external_config()
 
     if len(globals().get("EXTERNAL_TOOLS", [])) > 0:
+        from cha import local
+
         return local.get_tools()
     return []
 
 
+# NOTE: opt-in (CHA_PYTHON_USE_CONFIG_SNAPSHOT=1), the values of a static external config are cached so a launch does not have to execute it
+CONFIG_SNAPSHOT_FILE = os.path.join(LOCAL_CHA_CONFIG_CACHE_DIR, "config_snapshot.bin")
+
+
+def _config_snapshot_enabled():
+    return os.environ.get("CHA_PYTHON_USE_CONFIG_SNAPSHOT", "").lower() in ("1", "true")
+
+
+def _config_snapshot_key(config_path):
+    stat_result = os.stat(config_path)
+    # NOTE: the leading version drops snapshots written before only static configs were cached
+    return [
+        2,
+        os.path.abspath(config_path),
+        stat_result.st_mtime_ns,
+        stat_result.st_size,
+        list(sys.version_info[:2]),
+    ]
+
+
+def _is_static_config(config_path):
+    """
+    True if executing the config can only ever give the same values: its top level
+    is just imports, docstrings, and assignments, it makes no calls (besides in
+    EXTERNAL_TOOLS, which is never snapshotted), and it never reads the environment.
+    Anything else (e.g. an if on os.getenv, a sys.path insert) is executed every time.
+    """
+    import ast
+
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except:
+        return False
+
+    for statement in tree.body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            continue
+        if isinstance(statement, ast.Expr) and isinstance(
+            statement.value, ast.Constant
+        ):
+            continue
+        if not isinstance(statement, (ast.Assign, ast.AnnAssign)):
+            return False
+        targets = getattr(statement, "targets", None) or [statement.target]
+        if any(getattr(target, "id", None) == "EXTERNAL_TOOLS" for target in targets):
+            continue
+        for node in ast.walk(statement):
+            if isinstance(node, (ast.Call, ast.NamedExpr, ast.Await)):
+                return False
+            if getattr(node, "id", None) in ("environ", "getenv"):
+                return False
+            if getattr(node, "attr", None) in ("environ", "getenv"):
+                return False
+    return True
+
+
+def _read_config_snapshot(config_path):
+    if not _config_snapshot_enabled():
+        return None
+    try:
+        with open(CONFIG_SNAPSHOT_FILE, "rb") as f:
+            snapshot = marshal.load(f)
+        if snapshot["key"] == _config_snapshot_key(config_path):
+            return snapshot["values"]
+    except:
+        pass
+    return None
+
+
+def _write_config_snapshot(config_path, values):
+    # only plain values (str, numbers, lists, dicts, ...) can be snapshotted, anything else keeps executing the config
+    if not _config_snapshot_enabled():
+        return
+    if not os.path.isdir(LOCAL_CHA_CONFIG_DIR) or not _is_static_config(config_path):
+        return
+    try:
+        # NOTE: only called once the config's values are applied, utils reads some of them when imported
+        from cha import utils
+
+        data = marshal.dumps(
+            {"key": _config_snapshot_key(config_path), "values": values}
+        )
+        os.makedirs(LOCAL_CHA_CONFIG_CACHE_DIR, exist_ok=True)
+        utils.write_bytes_atomic(CONFIG_SNAPSHOT_FILE, data)
+    except:
+        pass
+
+
 CUSTOM_CONFIG_PATH = os.environ.get("CHA_PYTHON_CUSTOM_CONFIG_PATH")
 OVERRIGHT_CONFIG = None
 if CUSTOM_CONFIG_PATH and os.path.exists(CUSTOM_CONFIG_PATH):
@@ -871,12 +1073,25 @@ elif LOCAL_CHA_CONFIG_FILE and os.path.exists(LOCAL_CHA_CONFIG_FILE):
     OVERRIGHT_CONFIG = LOCAL_CHA_CONFIG_FILE
 
 if OVERRIGHT_CONFIG != None:
-    spec = importlib.util.spec_from_file_location("external_config", OVERRIGHT_CONFIG)
-    external_config = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(external_config)
+    external_values = _read_config_snapshot(OVERRIGHT_CONFIG)
+    write_snapshot = external_values is None
+    if write_snapshot:
+        spec = importlib.util.spec_from_file_location(
+            "external_config", OVERRIGHT_CONFIG
+        )
+        external_config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(external_config)
+
+        external_values = {
+            key: value
+            for key, value in external_config.__dict__.items()
+            if key.isupper() and key != "EXTERNAL_TOOLS"
+        }
+
+    for key, value in external_values.items():
+        globals()[key] = value
 
-    for key, value in external_config.__dict__.items():
-        if key.isupper() and key != "EXTERNAL_TOOLS":
-            globals()[key] = value
+    if write_snapshot:
+        _write_config_snapshot(OVERRIGHT_CONFIG, external_values)
 
 EXTERNAL_TOOLS_EXECUTE = []
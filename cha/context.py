@@ -0,0 +1,362 @@
+import re
+
+from cha import colors, utils, config, loading, conversation
+from cha.client import get_current_chat_client
+
+# NOTE: keeps each request inside the model's context window, the chat history itself is never modified
+
+# tokens each message costs on top of its content (role, separators)
+_MESSAGE_OVERHEAD_TOKENS = 4
+_TRIMMED_MARKER = "\n[... trimmed to fit the context window ...]"
+_SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+
+def context_window(model_name):
+    for pattern, tokens in config.MODEL_CONTEXT_WINDOWS.items():
+        if re.match(pattern, model_name or ""):
+            return tokens
+    return config.CHA_CONTEXT_DEFAULT_WINDOW
+
+
+def _message_text(message):
+    content = message["content"]
+    return content if isinstance(content, str) else str(content)
+
+
+def count_message_tokens(history, message, model_name, exact=False):
+    """
+    Counts a message's tokens once per content string and model, the count is cached
+    on the conversation so every later request only counts the new messages. The
+    count is a word based estimate unless exact is set and the tiktoken encoder is
+    already loaded, an exact count then replaces the cached estimate.
+    """
+    text = _message_text(message)
+    cached = history.token_counts.get(id(text))
+    if (
+        cached is not None
+        and cached[0] is text
+        and cached[1] == model_name
+        and (cached[3] or not exact)
+    ):
+        return cached[2]
+
+    tokens = None
+    encoder = utils.loaded_token_encoder(model_name) if exact else None
+    if encoder is not None:
+        try:
+            tokens = len(encoder.encode_ordinary(text))
+        except:
+            pass
+    counted_exactly = tokens is not None
+    if tokens is None:
+        tokens = utils.count_tokens(text, model_name, fast_mode=True)
+    tokens += _MESSAGE_OVERHEAD_TOKENS
+    history.token_counts[id(text)] = (text, model_name, tokens, counted_exactly)
+    return tokens
+
+
+def _truncate_message(message, tokens, keep_tokens):
+    text = _message_text(message)
+    keep_chars = int(len(text) * keep_tokens / max(tokens, 1))
+    return {"role": message["role"], "content": text[:keep_chars] + _TRIMMED_MARKER}
+
+
+def _group_tokens(group):
+    return sum(tokens for _, tokens in group)
+
+
+def _summary_model(selected_model):
+    # the small summary model is an openai one, other platforms summarize with the chat model
+    if (
+        config.CHA_CURRENT_PLATFORM_NAME == "openai"
+        and config.CHA_CONTEXT_SUMMARY_MODEL
+    ):
+        return config.CHA_CONTEXT_SUMMARY_MODEL
+    return selected_model
+
+
+def summarize_turns(turns, model_name, previous_summary=None):
+    lines = []
+    if previous_summary:
+        lines.append(f"Earlier summary:\n{previous_summary}")
+
+    keep_tokens = config.CHA_CONTEXT_TRIM_KEEP_TOKENS
+    for turn in turns:
+        for message in conversation.turn_messages(turn):
+            text = _message_text(message)
+            # NOTE: huge messages (e.g. code dumps) are summarized from their beginning only
+            tokens = utils.count_tokens(text, model_name, fast_mode=True)
+            if tokens > keep_tokens:
+                text = _truncate_message(message, tokens, keep_tokens)["content"]
+            speaker = "User" if message["role"] == "user" else "Assistant"
+            lines.append(f"{speaker}: {text}")
+
+    max_words = int(config.CHA_CONTEXT_SUMMARY_MAX_TOKENS * 0.75)
+    prompt = (
+        "Summarize the following conversation between a user and an assistant so it can "
+        "replace the conversation as context for the rest of the chat. Keep every fact, "
+        "decision, file name, code detail, and open question that later messages may "
+        f"need. Reply with the summary only, in at most {max_words} words.\n\n"
+        + "\n\n".join(lines)
+    )
+    response = get_current_chat_client().chat.completions.create(
+        model=model_name, messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _summarize_oldest(history, turns, groups, excess, model_name, quiet):
+    # folds the oldest turns into one summary message, reusing (and extending) the last summary
+    summary_budget = config.CHA_CONTEXT_SUMMARY_MAX_TOKENS
+    count, freed = 0, 0
+    while count < len(groups) - 1 and freed - summary_budget < excess:
+        freed += _group_tokens(groups[count])
+        count += 1
+    if count == 0:
+        return groups, 0
+
+    folded = turns[:count]
+    previous = history.summary
+    if (
+        previous is not None
+        and len(previous[0]) <= count
+        and all(a is b for a, b in zip(previous[0], folded))
+    ):
+        previous_turns, previous_text = previous
+    else:
+        previous_turns, previous_text = (), None
+
+    if len(previous_turns) == count:
+        summary = previous_text
+    else:
+        if not quiet:
+            loading.start_loading("Summarizing", "dots")
+        try:
+            summary = summarize_turns(
+                folded[len(previous_turns) :],
+                _summary_model(model_name),
+                previous_summary=previous_text,
+            )
+        finally:
+            if not quiet:
+                loading.stop_loading()
+        history.summary = (tuple(folded), summary)
+
+    message = {"role": "user", "content": _SUMMARY_HEADER + summary}
+    summary_group = [(message, count_message_tokens(history, message, model_name))]
+    return [summary_group] + groups[count:], count
+
+
+# NOTE: prompt cache layout, large static context (code dumps, loaded files) is kept at a stable prefix
+def pin_static_context(turns):
+    """
+    Moves the pinned turns (code dumps, loaded files, scraped pages) ahead of the
+    rest of the chat in their original order, so every request starts with the
+    same prefix and the provider's prompt cache can hit. The newest turn is the
+    one being sent, it always stays last.
+    """
+    if len(turns) < 2:
+        return turns
+    older = turns[:-1]
+    pinned = [turn for turn in older if turn.get("pinned")]
+    if not pinned:
+        return turns
+    return pinned + [turn for turn in older if not turn.get("pinned")] + turns[-1:]
+
+
+def _pinned_message_ids(groups, turns):
+    return {
+        id(message)
+        for group, turn in zip(groups, turns)
+        if turn.get("pinned")
+        for message, _ in group
+    }
+
+
+def uses_cache_control(model_name):
+    return config.CHA_PROMPT_CACHE_MODE and any(
+        re.search(pattern, model_name or "")
+        for pattern in config.CHA_PROMPT_CACHE_CONTROL_MODELS
+    )
+
+
+def _assemble(prefix, groups, pinned_ids, model_name):
+    messages = list(prefix)
+    prefix_end = len(messages) - 1
+    for group in groups:
+        for message, _ in group:
+            messages.append(message)
+            if id(message) in pinned_ids:
+                prefix_end = len(messages) - 1
+
+    # anthropic models only cache up to an explicit cache_control breakpoint
+    if prefix_end >= 0 and uses_cache_control(model_name):
+        message = messages[prefix_end]
+        messages[prefix_end] = {
+            "role": message["role"],
+            "content": [
+                {
+                    "type": "text",
+                    "text": _message_text(message),
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+        }
+    return messages
+
+
+def _count_messages(history, prefix, turns, model_name, exact):
+    prefix_tokens = sum(
+        count_message_tokens(history, message, model_name, exact) for message in prefix
+    )
+    groups = [
+        [
+            (message, count_message_tokens(history, message, model_name, exact))
+            for message in conversation.turn_messages(turn)
+        ]
+        for turn in turns
+    ]
+    return prefix_tokens, groups
+
+
+def build_messages(history, model_name, include_initial_prompt=True, quiet=False):
+    """
+    Builds the messages for the next request and, if they would not fit in the
+    model's context window (minus CHA_CONTEXT_RESERVED_TOKENS for the answer),
+    shrinks them according to CHA_CONTEXT_POLICY:
+        drop: leave out the oldest turns
+        trim: cut the oldest messages down to CHA_CONTEXT_TRIM_KEEP_TOKENS first
+        summarize: replace the oldest turns with a rolling summary
+    The initial prompt and the newest turn are always kept, and dropping is the
+    fallback of every policy. With CHA_PROMPT_CACHE_MODE the pinned turns are
+    laid out first (see pin_static_context). Returns (messages, report), report
+    is None when nothing had to change.
+
+    The messages are first sized with a word based estimate, only a chat above
+    CHA_CONTEXT_ESTIMATE_MARGIN of the budget is counted with tiktoken, and only
+    once its encoder has been loaded in the background (until then the estimate
+    is used), so a request never waits for tiktoken to load or download.
+    """
+    policy = config.CHA_CONTEXT_POLICY
+    prefix = []
+    if include_initial_prompt and history and history[0].get("user"):
+        prefix.append({"role": "user", "content": history[0]["user"]})
+
+    turns = [
+        turn for turn in history.context_turns() if conversation.turn_messages(turn)
+    ]
+    if config.CHA_PROMPT_CACHE_MODE:
+        turns = pin_static_context(turns)
+
+    if policy == "off":
+        groups = [
+            [(message, None) for message in conversation.turn_messages(turn)]
+            for turn in turns
+        ]
+        pinned_ids = _pinned_message_ids(groups, turns)
+        return _assemble(prefix, groups, pinned_ids, model_name), None
+
+    budget = context_window(model_name) - config.CHA_CONTEXT_RESERVED_TOKENS
+    exact = False
+    prefix_tokens, groups = _count_messages(history, prefix, turns, model_name, exact)
+    tokens_before = prefix_tokens + sum(_group_tokens(group) for group in groups)
+    if tokens_before > budget * config.CHA_CONTEXT_ESTIMATE_MARGIN:
+        # NOTE: close to the budget the estimate is not good enough, count exactly if tiktoken is ready
+        if utils.loaded_token_encoder(model_name) is None:
+            utils.warm_token_encoder(model_name)
+        else:
+            exact = True
+            prefix_tokens, groups = _count_messages(
+                history, prefix, turns, model_name, exact
+            )
+            tokens_before = prefix_tokens + sum(
+                _group_tokens(group) for group in groups
+            )
+
+    pinned_ids = _pinned_message_ids(groups, turns)
+    # NOTE: forget the counts of messages that are gone (e.g. after a backtrack or a load)
+    live_ids = {id(_message_text(message)) for group in groups for message, _ in group}
+    live_ids.update(id(_message_text(message)) for message in prefix)
+    history.token_counts = {
+        key: value for key, value in history.token_counts.items() if key in live_ids
+    }
+
+    if tokens_before <= budget:
+        return _assemble(prefix, groups, pinned_ids, model_name), None
+
+    report = {
+        "policy": policy,
+        "window": context_window(model_name),
+        "tokens_before": tokens_before,
+        "summarized": 0,
+        "trimmed": 0,
+        "dropped": 0,
+    }
+    excess = tokens_before - budget
+
+    if policy == "summarize":
+        try:
+            groups, report["summarized"] = _summarize_oldest(
+                history, turns, groups, excess, model_name, quiet
+            )
+        except Exception as e:
+            if config.CHA_DEBUG_MODE and not quiet:
+                print(colors.red(f"Failed to summarize the chat: {e}"))
+    elif policy == "trim":
+        keep_tokens = config.CHA_CONTEXT_TRIM_KEEP_TOKENS
+        for group in groups[:-1]:
+            for index, (message, tokens) in enumerate(group):
+                if excess <= 0 or tokens <= keep_tokens:
+                    continue
+                cut = min(excess, tokens - keep_tokens)
+                message = _truncate_message(message, tokens, tokens - cut)
+                group[index] = (
+                    message,
+                    count_message_tokens(history, message, model_name, exact),
+                )
+                excess -= tokens - group[index][1]
+                report["trimmed"] += 1
+
+    excess = prefix_tokens + sum(_group_tokens(group) for group in groups) - budget
+    while excess > 0 and len(groups) > 1:
+        excess -= _group_tokens(groups.pop(0))
+        report["dropped"] += 1
+
+    if excess > 0 and groups:
+        # NOTE: the newest turn alone is too big, keep as much of its beginning as fits
+        group = groups[-1]
+        message, tokens = group[-1]
+        if tokens > excess:
+            message = _truncate_message(message, tokens, tokens - excess)
+            group[-1] = (
+                message,
+                count_message_tokens(history, message, model_name, exact),
+            )
+            report["trimmed"] += 1
+
+    messages = _assemble(prefix, groups, pinned_ids, model_name)
+    report["tokens_after"] = prefix_tokens + sum(
+        _group_tokens(group) for group in groups
+    )
+    report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+
+    if not quiet:
+        print(colors.yellow(format_report(report)))
+    return messages, report
+
+
+def format_report(report):
+    changes = []
+    for key, noun in (
+        ("summarized", "old turn"),
+        ("trimmed", "message"),
+        ("dropped", "old turn"),
+    ):
+        if report[key]:
+            plural = "" if report[key] == 1 else "s"
+            changes.append(f"{key} {report[key]} {noun}{plural}")
+    changes = ", ".join(changes) or "no changes"
+    return (
+        f"Context window: {changes}, saved {report['tokens_saved']:,} tokens "
+        f"({report['tokens_after']:,} of {report['window']:,})"
+    )
@@ -0,0 +1,100 @@
+import time
+
+from cha import config
+
+
+def new_turn(user, bot="", model=None, platform=None):
+    return {
+        "time": time.time(),
+        "user": user,
+        "bot": bot,
+        "platform": platform or config.CHA_CURRENT_PLATFORM_NAME,
+        "model": model or config.CHA_DEFAULT_MODEL,
+    }
+
+
+def turn_messages(turn):
+    messages = []
+    if turn.get("user"):
+        messages.append({"role": "user", "content": turn["user"]})
+    if turn.get("bot"):
+        messages.append(
+            {"role": turn.get("bot_role", "assistant"), "content": turn["bot"]}
+        )
+    return messages
+
+
+class Conversation(list):
+    """
+    The chat history, one dict per turn (time, user, bot, platform, model) with the
+    first turn holding the initial prompt. Every turn's content lives here once, the
+    message list sent to a model is built over it on demand by messages(), so
+    nothing has to be rebuilt or kept in sync when turns are added, removed, or
+    loaded. It is still a plain list to everything that reads or saves the history.
+    """
+
+    def __init__(self, turns=None):
+        super().__init__(turns or [])
+        # turns before this index were cleared from the model's context but are kept in the history
+        self.context_start = 1
+        # token counts per message content and the rolling summary, both kept by the context module
+        self.token_counts = {}
+        self.summary = None
+
+    def add_turn(self, user, bot="", model=None, pinned=False, bot_role=None):
+        turn = new_turn(user, bot, model)
+        if pinned:
+            # large static context (e.g. a code dump), see context.pin_static_context
+            turn["pinned"] = True
+        if bot_role:
+            # an answer made by a cha feature (e.g. !w) is saved as the bot's but sent to the model as this role
+            turn["bot_role"] = bot_role
+        self.append(turn)
+        return turn
+
+    def discard_turn(self, turn):
+        # drops a turn that never got an answer (e.g. a cancelled or failed request)
+        if self and self[-1] is turn:
+            self.pop()
+            self.context_start = min(self.context_start, max(len(self), 1))
+
+    def remove_turns(self, indices):
+        """
+        Removes the turns at the given indices in one pass (the initial prompt at
+        index 0 is always kept), returns how many were removed.
+        """
+        indices = {index for index in indices if 1 <= index < len(self)}
+        if not indices:
+            return 0
+        count = len(indices)
+        self.context_start -= sum(1 for index in indices if index < self.context_start)
+        if min(indices) == len(self) - count:
+            # the usual backtrack drops the latest turns, only those are touched
+            del self[-count:]
+        else:
+            self[:] = [turn for index, turn in enumerate(self) if index not in indices]
+        return count
+
+    def replace(self, turns):
+        self[:] = turns
+        self.context_start = 1
+
+    def clear_context(self):
+        self.context_start = len(self)
+
+    def messages(self, include_initial_prompt=True):
+        """
+        The chat as role/content messages for a model. The message dicts are rebuilt
+        per request but their content is the turns' own strings, never a copy.
+        """
+        messages = []
+        if include_initial_prompt and self and self[0].get("user"):
+            messages.append({"role": "user", "content": self[0]["user"]})
+
+        for turn in self.context_turns():
+            messages.extend(turn_messages(turn))
+        return messages
+
+    def context_turns(self):
+        # the turns after the initial prompt that are still in the model's context
+        return self[max(self.context_start, 1) :]
@@ -0,0 +1,333 @@
+from types import SimpleNamespace
+import threading
+import tempfile
+import socket
+import struct
+import json
+import stat
+import time
+import os
+
+from cha import colors, config
+
+# NOTE: cha --daemon keeps the interpreter, the openai clients, and the tiktoken encoders warm for one-shot chats
+
+# the context module reads the current platform and client from globals, building messages is serialized
+_context_lock = threading.Lock()
+
+
+def socket_path():
+    if config.CHA_DAEMON_SOCKET_PATH:
+        return config.CHA_DAEMON_SOCKET_PATH
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"cha-{os.getuid()}", "daemon.sock")
+
+
+def _is_private(path, is_type):
+    # owned by this user, nobody else may read or write it, and never a symlink to something else
+    try:
+        stat_result = os.lstat(path)
+    except OSError:
+        return False
+    return (
+        is_type(stat_result.st_mode)
+        and stat_result.st_uid == os.getuid()
+        and not stat_result.st_mode & 0o077
+    )
+
+
+def _peer_uid(connection):
+    # the uid of the process on the other end of the socket, None where the os does not tell
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    return struct.unpack("3i", credentials)[1]
+
+
+def connect(timeout=None):
+    """
+    Returns a connected socket, or None if no daemon is running. The socket and its
+    directory have to belong to this user and be closed to everyone else, and the
+    process behind it has to run as this user, otherwise it is never talked to.
+    """
+    path = socket_path()
+    if not _is_private(os.path.dirname(path), stat.S_ISDIR) or not _is_private(
+        path, stat.S_ISSOCK
+    ):
+        return None
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout or config.CHA_DAEMON_CONNECT_TIMEOUT_SECONDS)
+    try:
+        connection.connect(path)
+        peer_uid = _peer_uid(connection)
+    except OSError:
+        connection.close()
+        return None
+    if peer_uid is not None and peer_uid != os.getuid():
+        connection.close()
+        return None
+    connection.settimeout(None)
+    return connection
+
+
+def _send(connection, message):
+    connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def _read_messages(connection):
+    with connection.makefile("r", encoding="utf-8") as reader:
+        for line in reader:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _usage_namespace(usage):
+    if usage is None:
+        return None
+    return SimpleNamespace(
+        prompt_tokens=usage["prompt_tokens"],
+        completion_tokens=usage["completion_tokens"],
+        prompt_tokens_details=SimpleNamespace(cached_tokens=usage["cached_tokens"]),
+    )
+
+
+def chat_chunks(connection, history, model_name, include_initial_prompt, quiet, result):
+    """
+    Asks the daemon to answer the chat and yields its chunks shaped like the openai
+    ones, so main._render_chat_stream prints them as if they came from the api.
+    result gets the time the daemon's api request started, its retry count, and
+    whether the answer was streamed.
+    """
+    from cha.client import get_current_chat_client_settings
+    from cha import context
+
+    _send(
+        connection,
+        {
+            "type": "chat",
+            "model": model_name,
+            "platform": config.CHA_CURRENT_PLATFORM_NAME,
+            "client": get_current_chat_client_settings(),
+            "history": list(history),
+            "context_start": history.context_start,
+            "include_initial_prompt": include_initial_prompt,
+        },
+    )
+    for message in _read_messages(connection):
+        if message["type"] == "context":
+            if not quiet:
+                print(colors.yellow(context.format_report(message["report"])))
+        elif message["type"] == "started":
+            result["started"] = message["time"]
+        elif message["type"] == "chunk":
+            delta = SimpleNamespace(
+                content=message.get("content"),
+                reasoning_content=message.get("reasoning"),
+            )
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=delta)] if message.get("delta") else [],
+                usage=_usage_namespace(message.get("usage")),
+            )
+        elif message["type"] == "done":
+            result["retries"] = message.get("retries", 0)
+            result["streamed"] = message.get("streamed", True)
+            return
+        elif message["type"] == "error":
+            raise Exception(message["message"])
+    raise Exception("The cha daemon closed the connection")
+
+
+def _build_messages(request, client):
+    from cha import context, conversation, client as client_module
+
+    history = conversation.Conversation(request["history"])
+    history.context_start = request.get("context_start", 1)
+    with _context_lock:
+        # NOTE: the summarize policy asks the current client of the current platform
+        config.CHA_CURRENT_PLATFORM_NAME = request["platform"]
+        client_module._current_chat_client_instance = client
+        return context.build_messages(
+            history,
+            request["model"],
+            include_initial_prompt=request.get("include_initial_prompt", True),
+            quiet=True,
+        )
+
+
+def _answer_chat(request, send):
+    from cha.client import get_chat_client, resolve_api_key
+    from cha import main
+
+    # NOTE: the key is never sent over the socket, it comes from the daemon's own environment
+    settings = request.get("client") or {}
+    client = get_chat_client(
+        resolve_api_key(settings.get("api_key_env")), settings.get("base_url")
+    )
+    messages, report = _build_messages(request, client)
+    if report is not None:
+        send({"type": "context", "report": report})
+
+    stats = main.new_request_stats()
+    response, streamed = main.open_chat_completion(
+        request["model"],
+        messages,
+        stats,
+        client=client,
+        platform_name=request["platform"],
+    )
+    send({"type": "started", "time": stats["started"]})
+    if not streamed:
+        send(
+            {
+                "type": "chunk",
+                "delta": True,
+                "content": response.choices[0].message.content,
+                "usage": main._usage_dict(getattr(response, "usage", None)),
+            }
+        )
+    else:
+        try:
+            for chunk in response:
+                message = {"type": "chunk", "delta": bool(chunk.choices)}
+                usage = getattr(chunk, "usage", None)
+                if usage is not None:
+                    message["usage"] = main._usage_dict(usage)
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    message["content"] = getattr(delta, "content", None)
+                    message["reasoning"] = main._delta_reasoning(delta)
+                send(message)
+        finally:
+            # NOTE: stops the upstream request too when the cha process went away (e.g. ctrl+c)
+            if hasattr(response, "close"):
+                response.close()
+    send({"type": "done", "retries": stats["retries"], "streamed": streamed})
+
+
+def _make_handler():
+    import socketserver
+
+    class DaemonRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def send(message):
+                self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                peer_uid = _peer_uid(self.connection)
+                if peer_uid is not None and peer_uid != os.getuid():
+                    return
+                request = json.loads(self.rfile.readline())
+                if request.get("type") == "ping":
+                    send({"type": "pong", "pid": os.getpid()})
+                elif request.get("type") == "stop":
+                    send({"type": "stopping", "pid": os.getpid()})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                elif request.get("type") == "chat":
+                    try:
+                        _answer_chat(request, send)
+                    except (BrokenPipeError, ConnectionResetError):
+                        raise
+                    except Exception as e:
+                        send({"type": "error", "message": str(e)})
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except Exception as e:
+                if config.CHA_DEBUG_MODE:
+                    print(colors.red(f"Failed to handle a daemon request: {e}"))
+
+    return DaemonRequestHandler
+
+
+def _warm_up():
+    # NOTE: main and context are imported here so the first chat does not pay for them
+    from cha import utils, main, context
+    from cha.client import get_current_chat_client_settings, get_chat_client
+    from cha.client import resolve_api_key
+
+    settings = get_current_chat_client_settings()
+    get_chat_client(resolve_api_key(settings["api_key_env"]), settings["base_url"])
+    utils.get_token_encoder(config.CHA_DEFAULT_MODEL)
+
+
+def _request(message_type):
+    connection = connect()
+    if connection is None:
+        return None
+    try:
+        _send(connection, {"type": message_type})
+        return next(_read_messages(connection), None)
+    finally:
+        connection.close()
+
+
+def status():
+    reply = _request("ping")
+    if reply is None:
+        print(colors.yellow("The cha daemon is not running"))
+    else:
+        print(colors.green(f"The cha daemon is running (pid {reply['pid']})"))
+        print(colors.magenta(socket_path()))
+
+
+def stop():
+    reply = _request("stop")
+    if reply is None:
+        print(colors.yellow("The cha daemon is not running"))
+    else:
+        print(colors.green(f"Stopped the cha daemon (pid {reply['pid']})"))
+
+
+def serve():
+    """
+    Runs the daemon in the foreground until ctrl+c or cha --daemon stop. One-shot
+    chats (cha "question", git diff | cha) of any cha started meanwhile are sent
+    here, so they skip importing openai, building the client, and loading the
+    tiktoken encoder, and reuse the client's open connections.
+    """
+    import socketserver
+
+    path = socket_path()
+    if _request("ping") is not None:
+        print(colors.yellow("The cha daemon is already running"))
+        return
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    directory_stat = os.lstat(directory)
+    if stat.S_ISDIR(directory_stat.st_mode) and directory_stat.st_uid == os.getuid():
+        # e.g. created by an older cha or under a loose umask
+        os.chmod(directory, 0o700)
+    if not _is_private(directory, stat.S_ISDIR):
+        print(
+            colors.red(
+                f"Refusing to start, {directory} has to be a directory owned by you that no one else can access"
+            )
+        )
+        return
+    if os.path.lexists(path):
+        # NOTE: left behind by a daemon that did not shut down cleanly
+        os.remove(path)
+
+    started = time.time()
+    _warm_up()
+
+    server = socketserver.ThreadingUnixStreamServer(path, _make_handler())
+    server.daemon_threads = True
+    os.chmod(path, 0o600)
+    print(
+        colors.green(
+            f"Cha daemon ready in {time.time() - started:.2f}s (ctrl+c to stop)"
+        )
+    )
+    print(colors.magenta(path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        server.server_close()
+        if os.path.lexists(path):
+            os.remove(path)
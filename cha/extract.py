@@ -0,0 +1,285 @@
+from html.parser import HTMLParser
+import string
+import re
+
+from cha import config
+
+# NOTE: compiled once, filtering characters one by one against string.printable was the slowest part of scraping
+_NON_PRINTABLE_PATTERN = re.compile(f"[^{re.escape(string.printable)}]+")
+_REPEATED_SPACES_PATTERN = re.compile(" +")
+
+
+def clean_text(text):
+    text = _NON_PRINTABLE_PATTERN.sub("", text)
+    return _REPEATED_SPACES_PATTERN.sub(" ", text)
+
+
+def _lazy_import_lxml():
+    global lxml_html, lxml_etree
+    try:
+        from lxml import html as lxml_html
+        from lxml import etree as lxml_etree
+
+        return True
+    except ImportError:
+        return False
+
+
+def lxml_extractor(content):
+    parser = lxml_html.HTMLParser(encoding="utf-8", remove_comments=True)
+    # NOTE: lxml refuses str input that has an xml encoding declaration, so always hand it bytes
+    tree = lxml_html.document_fromstring(
+        content.encode("utf-8", errors="ignore"), parser=parser
+    )
+    lxml_etree.strip_elements(
+        tree,
+        *config.SCRAPER_HTML_IGNORED_TAGS,
+        lxml_etree.ProcessingInstruction,
+        with_tail=False,
+    )
+    strings = []
+    for text in tree.itertext():
+        text = text.strip()
+        if text:
+            strings.append(text)
+    return " ".join(strings)
+
+
+class _StreamingTextParser(HTMLParser):
+    # collects the page's text in one pass, skipping everything inside an ignored tag
+    def __init__(self, ignored_tags):
+        super().__init__(convert_charrefs=True)
+        self.ignored_tags = set(ignored_tags)
+        self.ignored_depth = 0
+        self.strings = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.ignored_tags:
+            self.ignored_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        # self-closing tags (e.g. <svg/>) never get an end tag, so never count them
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in self.ignored_tags and self.ignored_depth > 0:
+            self.ignored_depth -= 1
+
+    def handle_data(self, data):
+        if self.ignored_depth:
+            return
+        data = data.strip()
+        if data:
+            self.strings.append(data)
+
+
+def stdlib_extractor(content):
+    parser = _StreamingTextParser(config.SCRAPER_HTML_IGNORED_TAGS)
+    parser.feed(content)
+    parser.close()
+    return " ".join(parser.strings)
+
+
+def bs4_extractor(content):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+    for data in soup(config.SCRAPER_HTML_IGNORED_TAGS):
+        data.decompose()
+    return " ".join(soup.stripped_strings)
+
+
+HTML_EXTRACTORS = {
+    "lxml": lxml_extractor,
+    "stdlib": stdlib_extractor,
+    "bs4": bs4_extractor,
+}
+
+
+def available_extractors():
+    names = []
+    if _lazy_import_lxml():
+        names.append("lxml")
+    names.append("stdlib")
+    names.append("bs4")
+    return names
+
+
+def get_extractor(name=None):
+    name = name or config.SCRAPER_HTML_EXTRACTOR
+    if name == "auto" or name not in HTML_EXTRACTORS:
+        name = available_extractors()[0]
+    elif name == "lxml" and not _lazy_import_lxml():
+        name = "stdlib"
+    return HTML_EXTRACTORS[name]
+
+
+def html_to_text(content, extractor=None):
+    try:
+        text = get_extractor(extractor)(content)
+    except Exception:
+        # NOTE: the stdlib tokenizer never needs a third party parser, so it is the last resort
+        text = stdlib_extractor(content)
+    return clean_text(text)
+
+
+# NOTE: everything below is used for the readability-style "main content" mode
+_BLOCK_TAGS = {
+    "address",
+    "article",
+    "blockquote",
+    "body",
+    "br",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "figcaption",
+    "figure",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "hr",
+    "li",
+    "main",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "td",
+    "th",
+    "tr",
+    "ul",
+}
+_CONTAINER_TAGS = {"article", "body", "div", "main", "section", "td"}
+_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+_MAIN_CONTENT_EXTRA_IGNORED_TAGS = {"header", "aside", "form", "button", "select"}
+
+
+class _MainContentParser(HTMLParser):
+    # splits the page into text blocks, each one tagged with its enclosing containers and link text size
+    def __init__(self, ignored_tags):
+        super().__init__(convert_charrefs=True)
+        self.ignored_tags = set(ignored_tags) | _MAIN_CONTENT_EXTRA_IGNORED_TAGS
+        self.ignored_depth = 0
+        self.link_depth = 0
+        self.containers = [(0, "root")]
+        self.next_container_id = 1
+        self.blocks = []
+        self.current = []
+        self.current_link_chars = 0
+        self.current_is_heading = False
+
+    def flush(self):
+        text = " ".join(" ".join(self.current).split())
+        if text:
+            self.blocks.append(
+                {
+                    "text": text,
+                    "link_chars": self.current_link_chars,
+                    "heading": self.current_is_heading,
+                    "containers": [cid for cid, _ in self.containers],
+                }
+            )
+        self.current = []
+        self.current_link_chars = 0
+        self.current_is_heading = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.ignored_tags:
+            self.ignored_depth += 1
+            return
+        if self.ignored_depth:
+            return
+        if tag in _BLOCK_TAGS:
+            self.flush()
+        if tag in _HEADING_TAGS:
+            self.current_is_heading = True
+        if tag in _CONTAINER_TAGS:
+            self.containers.append((self.next_container_id, tag))
+            self.next_container_id += 1
+        if tag == "a":
+            self.link_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.ignored_depth and tag in _BLOCK_TAGS:
+            self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.ignored_tags:
+            if self.ignored_depth > 0:
+                self.ignored_depth -= 1
+            return
+        if self.ignored_depth:
+            return
+        if tag in _BLOCK_TAGS:
+            self.flush()
+        if tag in _CONTAINER_TAGS:
+            # NOTE: html in the wild has unclosed tags, so pop up to the nearest matching container
+            for index in range(len(self.containers) - 1, 0, -1):
+                if self.containers[index][1] == tag:
+                    del self.containers[index:]
+                    break
+        if tag == "a" and self.link_depth > 0:
+            self.link_depth -= 1
+
+    def handle_data(self, data):
+        if self.ignored_depth:
+            return
+        self.current.append(data)
+        if self.link_depth:
+            self.current_link_chars += len(data.strip())
+
+
+def main_content(content, min_block_chars=25, max_link_density=0.5):
+    """
+    Readability-style extraction of a page's main text. Link-heavy and tiny blocks
+    are dropped, the container holding the most prose wins, and the kept blocks are
+    returned as paragraphs separated by blank lines.
+    """
+    parser = _MainContentParser(config.SCRAPER_HTML_IGNORED_TAGS)
+    try:
+        parser.feed(content)
+        parser.close()
+    except Exception:
+        pass
+    parser.flush()
+
+    good_blocks = []
+    scores = {}
+    for block in parser.blocks:
+        text_length = len(block["text"])
+        link_density = block["link_chars"] / max(text_length, 1)
+        if link_density > max_link_density:
+            continue
+        if text_length < min_block_chars and not block["heading"]:
+            continue
+        good_blocks.append(block)
+        if block["heading"]:
+            continue
+
+        # the parent gets the full score and the grandparent half, like readability does
+        score = 1 + min(text_length / 100, 3)
+        containers = block["containers"]
+        scores[containers[-1]] = scores.get(containers[-1], 0) + score
+        if len(containers) > 1:
+            scores[containers[-2]] = scores.get(containers[-2], 0) + score / 2
+
+    if not good_blocks:
+        return clean_text(" ".join(block["text"] for block in parser.blocks))
+
+    selected = good_blocks
+    if scores:
+        best = max(scores, key=scores.get)
+        best_blocks = [block for block in good_blocks if best in block["containers"]]
+        best_chars = sum(len(block["text"]) for block in best_blocks)
+        total_chars = sum(len(block["text"]) for block in good_blocks)
+        # NOTE: pages like forum threads spread their content over many siblings, keep everything then
+        if best_chars >= total_chars * 0.5:
+            selected = best_blocks
+
+    return clean_text("\n\n".join(block["text"] for block in selected))
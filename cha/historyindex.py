@@ -0,0 +1,297 @@
+from datetime import datetime
+import threading
+import sqlite3
+import json
+import time
+import glob
+import re
+import os
+
+from cha import colors, utils, config
+
+# NOTE: a full text index over ~/.cha/history, callers fall back to rg whenever it can not answer
+_HISTORY_INDEX_DB_NAME = "history_index.sqlite3"
+_FILTER_PATTERN = re.compile(r"\b(model|platform|since|until):(\S+)", re.IGNORECASE)
+_RELATIVE_TIME_PATTERN = re.compile(r"^(\d+)([hdwmy])$")
+_RELATIVE_TIME_UNITS = {
+    "h": 60 * 60,
+    "d": 24 * 60 * 60,
+    "w": 7 * 24 * 60 * 60,
+    "m": 30 * 24 * 60 * 60,
+    "y": 365 * 24 * 60 * 60,
+}
+
+_SCHEMA = (
+    # files tell which history files are indexed as of which version, turns hold each turn's metadata
+    """
+    CREATE TABLE IF NOT EXISTS history_files (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS history_turns (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL,
+        turn_index INTEGER NOT NULL,
+        time REAL,
+        platform TEXT,
+        model TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS history_turns_path ON history_turns(path)",
+    "CREATE INDEX IF NOT EXISTS history_turns_time ON history_turns(time)",
+    # the text of each turn, its rowid is the id of the matching history_turns row
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS history_fts
+    USING fts5(user, bot, tokenize = 'porter unicode61')
+    """,
+)
+
+_db_lock = threading.Lock()
+_db_connection = None
+
+
+def _get_connection():
+    global _db_connection
+    if _db_connection is None and config.CHA_USE_HISTORY_INDEX:
+        _db_connection = utils.open_cache_db(_HISTORY_INDEX_DB_NAME, _SCHEMA)
+    return _db_connection
+
+
+def _clip(text):
+    text = text if isinstance(text, str) else str(text or "")
+    return text[: config.CHA_HISTORY_INDEX_MAX_FIELD_CHARS]
+
+
+def _remove_file(connection, path):
+    connection.execute(
+        "DELETE FROM history_fts WHERE rowid IN (SELECT id FROM history_turns WHERE path = ?)",
+        (path,),
+    )
+    connection.execute("DELETE FROM history_turns WHERE path = ?", (path,))
+    connection.execute("DELETE FROM history_files WHERE path = ?", (path,))
+
+
+def _index_file(connection, path, chat, stat_result):
+    _remove_file(connection, path)
+    # the first turn is the initial prompt, it is the same in every file
+    for turn_index, turn in enumerate(chat[1:], 1):
+        if not isinstance(turn, dict):
+            continue
+        cursor = connection.execute(
+            "INSERT INTO history_turns (path, turn_index, time, platform, model) VALUES (?, ?, ?, ?, ?)",
+            (
+                path,
+                turn_index,
+                turn.get("time"),
+                turn.get("platform"),
+                turn.get("model"),
+            ),
+        )
+        connection.execute(
+            "INSERT INTO history_fts (rowid, user, bot) VALUES (?, ?, ?)",
+            (cursor.lastrowid, _clip(turn.get("user")), _clip(turn.get("bot"))),
+        )
+    connection.execute(
+        "INSERT INTO history_files (path, mtime_ns, size) VALUES (?, ?, ?)",
+        (path, stat_result.st_mtime_ns, stat_result.st_size),
+    )
+
+
+def _load_chat(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    chat = data.get("chat") if isinstance(data, dict) else data
+    return chat if isinstance(chat, list) else []
+
+
+def index_history_file(path, chat=None):
+    # indexes one (just written) history file, chat saves re-reading it
+    try:
+        path = os.path.abspath(path)
+        stat_result = os.stat(path)
+        if chat is None:
+            chat = _load_chat(path)
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return False
+            _index_file(connection, path, chat, stat_result)
+            connection.commit()
+        return True
+    except Exception:
+        return False
+
+
+def update_index(history_dir=None):
+    """
+    Brings the index in line with the history directory: new and changed files
+    (by mtime and size) are (re)indexed and deleted ones are dropped, unchanged
+    files are never read. Returns False if the index is unavailable.
+    """
+    history_dir = os.path.abspath(history_dir or config.LOCAL_CHA_CONFIG_HISTORY_DIR)
+    try:
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return False
+
+            indexed = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in connection.execute(
+                    "SELECT path, mtime_ns, size FROM history_files"
+                )
+            }
+            current = set()
+            for path in glob.glob(os.path.join(history_dir, "*.json")):
+                current.add(path)
+                try:
+                    stat_result = os.stat(path)
+                    if indexed.get(path) == (
+                        stat_result.st_mtime_ns,
+                        stat_result.st_size,
+                    ):
+                        continue
+                    _index_file(connection, path, _load_chat(path), stat_result)
+                except Exception:
+                    continue
+
+            for path in indexed:
+                if path not in current and path.startswith(history_dir):
+                    _remove_file(connection, path)
+            connection.commit()
+        return True
+    except Exception:
+        return False
+
+
+def _parse_time(value, end_of_day=False):
+    value = value.strip().lower()
+    relative = _RELATIVE_TIME_PATTERN.match(value)
+    if relative:
+        return (
+            time.time()
+            - int(relative.group(1)) * _RELATIVE_TIME_UNITS[relative.group(2)]
+        )
+    parsed = datetime.strptime(value, "%Y-%m-%d").timestamp()
+    return parsed + 24 * 60 * 60 if end_of_day else parsed
+
+
+def parse_query(query):
+    """
+    Splits a search like "docker compose model:gpt-4.1 since:2w" into its text and
+    filters. model matches any part of the model name, platform is exact, since and
+    until take a YYYY-MM-DD date or a relative age (e.g. 12h, 3d, 2w, 6m, 1y).
+    """
+    filters = {}
+    for key, value in _FILTER_PATTERN.findall(query or ""):
+        filters[key.lower()] = value
+    text = _FILTER_PATTERN.sub(" ", query or "").strip()
+    return text, filters
+
+
+def _match_expression(text, exact):
+    if exact:
+        return '"' + text.replace('"', '""') + '"'
+    # every word has to appear, each one as a prefix (e.g. "dock" finds docker)
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(query=None, exact=False, limit=None):
+    """
+    Ranked search over the indexed history turns. Returns a list of dicts (path,
+    turn_index, time, platform, model, user, bot), best matches first (bm25, then
+    newest), or just the newest turns when the query has no text. Returns None if
+    the index is unavailable.
+    """
+    limit = limit or config.CHA_HISTORY_SEARCH_LIMIT
+    text, filters = parse_query(query)
+    match = _match_expression(text, exact) if text else ""
+
+    conditions, params = [], []
+    if match:
+        conditions.append("history_fts MATCH ?")
+        params.append(match)
+    if filters.get("model"):
+        conditions.append("t.model LIKE ?")
+        params.append(f"%{filters['model']}%")
+    if filters.get("platform"):
+        conditions.append("LOWER(t.platform) = ?")
+        params.append(filters["platform"].lower())
+    try:
+        if filters.get("since"):
+            conditions.append("t.time >= ?")
+            params.append(_parse_time(filters["since"]))
+        if filters.get("until"):
+            conditions.append("t.time < ?")
+            params.append(_parse_time(filters["until"], end_of_day=True))
+    except ValueError:
+        return []
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "bm25(history_fts), t.time DESC" if match else "t.time DESC"
+    try:
+        with _db_lock:
+            connection = _get_connection()
+            if connection is None:
+                return None
+            rows = connection.execute(
+                f"""
+                SELECT t.path, t.turn_index, t.time, t.platform, t.model, f.user, f.bot
+                FROM history_fts f
+                JOIN history_turns t ON t.id = f.rowid
+                {where}
+                ORDER BY {order}
+                LIMIT ?
+                """,
+                (*params, limit),
+            ).fetchall()
+    except sqlite3.OperationalError:
+        # e.g. an fts query syntax error from odd input
+        return []
+    except Exception:
+        return None
+
+    keys = ("path", "turn_index", "time", "platform", "model", "user", "bot")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def _escape_preview(text):
+    # fzf previews it with printf %b, so only the escapes added here are interpreted
+    return text.replace("\\", "\\\\").replace("\t", "    ").replace("\n", "\\n")
+
+
+def fzf_lines(results):
+    """
+    One tab separated line per search result for fzf: the history file's path, the
+    shown label (date, platform:model, start of the turn), and the turn's preview.
+    """
+    lines = []
+    preview_chars = config.CHA_HISTORY_PREVIEW_CHARS
+    for result in results:
+        date = "?"
+        if result["time"]:
+            date = time.strftime("%Y-%m-%d %H:%M", time.localtime(result["time"]))
+        source = f"{result['platform'] or '?'}:{result['model'] or '?'}"
+        user, bot = result["user"] or "", result["bot"] or ""
+        label = " ".join((user or bot).split())[:200]
+        preview = (
+            f"{result['path']}\n{date} [{source}]\n\n"
+            f"User: {user[:preview_chars]}\n\n{bot[:preview_chars]}"
+        )
+        lines.append(
+            f"{result['path']}\t{colors.red(date)} {colors.magenta(source)} {label}\t{_escape_preview(preview)}"
+        )
+    return lines
+
+
+if __name__ == "__main__":
+    # NOTE: cha -hs runs this on every keystroke (fzf reload), usage: [fuzzy|exact] [query]
+    import sys
+
+    exact = len(sys.argv) > 1 and sys.argv[1] == "exact"
+    results = search(" ".join(sys.argv[2:]), exact=exact) or []
+    print("\n".join(fzf_lines(results)))
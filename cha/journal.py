@@ -0,0 +1,229 @@
+from datetime import datetime, timezone
+import json
+import time
+import uuid
+import os
+
+from cha import colors, utils, config, historyindex
+
+# NOTE: an append-only jsonl journal per session, so a crash or a closed terminal never loses a chat
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def journal_dir():
+    return os.path.join(config.LOCAL_CHA_CONFIG_HISTORY_DIR, "journal")
+
+
+def is_enabled():
+    return config.CHA_LOCAL_SAVE_ALL_CHA_CHATS == True and os.path.isdir(
+        config.LOCAL_CHA_CONFIG_HISTORY_DIR
+    )
+
+
+def _version_id():
+    try:
+        from importlib.metadata import version
+
+        return str(version("cha"))
+    except:
+        return "?"
+
+
+def history_save_data(chat, args=None, epoch_time_seconds=None, file_id=None):
+    # the cha_hs_*.json format
+    epoch_time_seconds = epoch_time_seconds or time.time()
+    return {
+        "chat": chat,
+        "id": file_id or str(uuid.uuid4()),
+        "version": _version_id(),
+        "date": {
+            "epoch": {"seconds": epoch_time_seconds},
+            "utc": f"{datetime.fromtimestamp(epoch_time_seconds, timezone.utc)} UTC",
+        },
+        "args": args or {},
+        "config": utils.get_json_serializable_globals(config),
+    }
+
+
+def write_history_file(history_save):
+    """
+    Writes a cha_hs_<epoch>.json file (never over an existing one), adds it to the
+    history search index, and returns its path. The file is written next to its
+    final name and then renamed into place.
+    """
+    epoch = int(history_save["date"]["epoch"]["seconds"])
+    while True:
+        file_path = os.path.join(
+            config.LOCAL_CHA_CONFIG_HISTORY_DIR, f"cha_hs_{epoch}.json"
+        )
+        if not os.path.exists(file_path):
+            break
+        epoch += 1
+
+    utils.write_json_atomic(file_path, history_save, indent=4)
+    historyindex.index_history_file(file_path, history_save["chat"])
+    return file_path
+
+
+class HistoryJournal:
+    """
+    Appends every finished turn of a session to a jsonl file as soon as the chat
+    loop gets back to the prompt. Each append is flushed right away, so it survives
+    the process being killed, while fsync (which only matters if the machine
+    itself goes down) is batched to once per CHA_HISTORY_JOURNAL_FSYNC_SECONDS. A
+    history that was not simply extended (backtrack, load, editor undo) is written
+    as one reset record. On a clean exit the session is compacted into the usual
+    cha_hs_*.json file and the journal removed, orphaned journals are recovered on
+    the next start.
+    """
+
+    def __init__(self, args=None):
+        self.started = time.time()
+        self.path = os.path.join(
+            journal_dir(), f"cha_journal_{int(self.started)}_{os.getpid()}.jsonl"
+        )
+        self.args = args or {}
+        self.file = None
+        self.journaled = []
+        self.last_fsync = 0
+
+    def _open(self):
+        os.makedirs(journal_dir(), exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8")
+        if fcntl is not None:
+            # the lock tells recover_orphaned_journals that this session is still alive
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._write(
+            {
+                "type": "session",
+                "id": str(uuid.uuid4()),
+                "pid": os.getpid(),
+                "started": self.started,
+                "args": self.args,
+            }
+        )
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def sync(self, history):
+        # journals whatever changed in the history since the last sync
+        if self.file is None and len(history) <= 1:
+            return
+
+        count = len(self.journaled)
+        is_extension = count <= len(history) and all(
+            turn is history[index] and bot is turn.get("bot")
+            for index, (turn, bot) in enumerate(self.journaled)
+        )
+        if is_extension and count == len(history):
+            return
+
+        try:
+            if self.file is None:
+                self._open()
+            if is_extension:
+                for turn in history[count:]:
+                    self._write({"type": "turn", "turn": turn})
+            else:
+                self._write({"type": "reset", "chat": list(history)})
+            self.file.flush()
+
+            now = time.time()
+            if now - self.last_fsync >= config.CHA_HISTORY_JOURNAL_FSYNC_SECONDS:
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+        except Exception as e:
+            if config.CHA_DEBUG_MODE:
+                print(colors.red(f"Failed to write the history journal: {e}"))
+            return
+
+        self.journaled = [(turn, turn.get("bot")) for turn in history]
+
+    def close(self, remove=False):
+        if self.file is not None:
+            try:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except:
+                pass
+            self.file.close()
+            self.file = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def replay_journal(path):
+    """
+    Rebuilds a session's chat from its journal, returns (session, chat). A torn
+    last line (the process died mid write) is ignored.
+    """
+    session, chat = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("type") == "session":
+                session = record
+            elif record.get("type") == "turn":
+                chat.append(record["turn"])
+            elif record.get("type") == "reset":
+                chat = list(record["chat"])
+    return session, chat
+
+
+def _is_orphaned(path):
+    if fcntl is None:
+        return True
+    try:
+        with open(path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return True
+    except OSError:
+        return False
+
+
+def recover_orphaned_journals(quiet=False):
+    """
+    Compacts the journals of sessions that ended without a clean exit into
+    cha_hs_*.json files, returns the paths of the recovered history files.
+    """
+    directory = journal_dir()
+    if not os.path.isdir(directory):
+        return []
+
+    recovered = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith(".jsonl") or not _is_orphaned(path):
+            continue
+        try:
+            session, chat = replay_journal(path)
+            if len(chat) > 1:
+                recovered.append(
+                    write_history_file(
+                        history_save_data(
+                            chat,
+                            args=session.get("args"),
+                            epoch_time_seconds=session.get("started")
+                            or os.path.getmtime(path),
+                            file_id=session.get("id"),
+                        )
+                    )
+                )
+            os.remove(path)
+        except Exception as e:
+            if config.CHA_DEBUG_MODE and not quiet:
+                print(colors.red(f"Failed to recover {path}: {e}"))
+
+    if recovered and not quiet:
+        chat_word = "chat" if len(recovered) == 1 else "chats"
+        print(colors.yellow(f"Recovered {len(recovered)} unsaved {chat_word}"))
+    return recovered
@@ -178,8 +178,113 @@ def read_json(path):
     return content
 
 
-def browse_and_select_history_file(exact_mode=False):
+def _select_history_with_rg(history_dir, exact_mode=False):
+    # the fallback when the history index is unavailable, searches every line of every file
     from cha import utils
+
+    rg_command = [
+        "rg",
+        "--line-number",
+        "--color=always",
+        "",
+        "--glob",
+        "*.json",
+        history_dir,
+    ]
+
+    header_text = "{} | [Shift↑/↓] [ESC] [ENTER]".format(
+        "EXACT (use 'query' for literal)" if exact_mode else "FUZZY"
+    )
+    fzf_command = [
+        "fzf",
+        "--ansi",
+        "--delimiter",
+        ":",
+        "--preview",
+        "jq -r '.chat[] | \"User: \\(.user)\\n\\(.bot)\\n\"' {1} | bat --color=always --style=numbers --pager=never",
+        "--preview-window=right,60%,wrap",
+        "--header",
+        header_text,
+    ]
+    if exact_mode:
+        fzf_command.append("--exact")
+
+    rg_process = subprocess.run(
+        rg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if rg_process.returncode != 0 and rg_process.returncode != 1:
+        return None
+
+    fzf_result = utils.run_fzf_ssh_safe(fzf_command, rg_process.stdout)
+    if not fzf_result:
+        return None
+
+    selected_line = fzf_result.strip()
+    if selected_line:
+        return selected_line.split(":", 1)[0]
+    return None
+
+
+def _select_history_from_index(results, exact_mode=False, query=None):
+    from cha import historyindex, utils
+    import shlex
+    import sys
+
+    lines = historyindex.fzf_lines(results)
+    if not lines and not query:
+        print(colors.yellow("No chat history found"))
+        return None
+
+    # NOTE: fzf only shows the lines, every edit of the query re-runs the search over the whole index
+    reload_command = "{} -m cha.historyindex {} {{q}}".format(
+        shlex.quote(sys.executable), "exact" if exact_mode else "fuzzy"
+    )
+    header_text = "{} | [Shift↑/↓] [ESC] [ENTER]".format(
+        "EXACT" if exact_mode else "FUZZY"
+    )
+    fzf_command = [
+        "fzf",
+        "--ansi",
+        "--disabled",
+        "--query",
+        query or "",
+        "--bind",
+        f"change:reload:{reload_command}",
+        "--delimiter",
+        "\t",
+        "--with-nth",
+        "2",
+        "--preview",
+        "printf '%b' {3}",
+        "--preview-window=right,60%,wrap",
+        "--header",
+        header_text,
+    ]
+
+    fzf_result = utils.run_fzf_ssh_safe(fzf_command, "\n".join(lines))
+    if not fzf_result:
+        return None
+    return fzf_result.strip().split("\t", 1)[0] or None
+
+
+def parse_history_search_args(text):
+    # "[fuzzy|exact] [query]" -> (exact_mode, query)
+    words = (text or "").strip().split(maxsplit=1)
+    exact_mode = bool(words) and words[0].lower() == "exact"
+    if words and words[0].lower() in ("exact", "fuzzy"):
+        words = words[1:]
+    return exact_mode, (words[0].strip() if words else None)
+
+
+def browse_and_select_history_file(exact_mode=False, query=None):
+    """
+    Lets the user pick a saved chat with fzf. The turns come from the history
+    index, ranked by the query (which also takes model:, platform:, since:, and
+    until: filters) and searched again over every saved turn as the query is
+    edited in fzf. Their previews are rendered from it, rg is only used if the
+    index is unavailable.
+    """
+    from cha import historyindex
     import glob
 
     history_dir = os.path.join(os.environ["HOME"], ".cha", "history")
@@ -192,46 +297,14 @@ def browse_and_select_history_file(exact_mode=False):
         if not json_files:
             return None
 
-        rg_command = [
-            "rg",
-            "--line-number",
-            "--color=always",
-            "",
-            "--glob",
-            "*.json",
-            history_dir,
-        ]
-
-        header_text = "{} | [Shift↑/↓] [ESC] [ENTER]".format(
-            "EXACT (use 'query' for literal)" if exact_mode else "FUZZY"
-        )
-        fzf_command = [
-            "fzf",
-            "--ansi",
-            "--delimiter",
-            ":",
-            "--preview",
-            "jq -r '.chat[] | \"User: \\(.user)\\n\\(.bot)\\n\"' {1} | bat --color=always --style=numbers --pager=never",
-            "--preview-window=right,60%,wrap",
-            "--header",
-            header_text,
-        ]
-        if exact_mode:
-            fzf_command.append("--exact")
-
-        rg_process = subprocess.run(
-            rg_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        if rg_process.returncode != 0 and rg_process.returncode != 1:
-            return None
+        results = None
+        if historyindex.update_index(history_dir):
+            results = historyindex.search(query, exact=exact_mode)
 
-        fzf_result = utils.run_fzf_ssh_safe(fzf_command, rg_process.stdout)
-        if not fzf_result:
-            return None
-
-        selected_line = fzf_result.strip()
-        if selected_line:
-            selected_path = selected_line.split(":", 1)[0]
+        if results is not None:
+            selected_path = _select_history_from_index(results, exact_mode, query)
+        else:
+            selected_path = _select_history_with_rg(history_dir, exact_mode)
 
     except (subprocess.CalledProcessError, KeyboardInterrupt):
         return None
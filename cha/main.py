@@ -1,5 +1,4 @@
 import subprocess
-import traceback
 import argparse
 import tempfile
 import time
@@ -10,28 +9,25 @@ import os
 import re
 
 try:
-    from cha import colors, utils, config, loading, platforms
+    from cha import colors, utils, config, loading, stream, conversation
     from cha.client import (
         get_current_chat_client,
         set_current_chat_client,
+        prewarm_current_chat_client,
     )
 except (KeyboardInterrupt, EOFError):
     sys.exit(1)
 
 
-CURRENT_CHAT_HISTORY = [
-    {
-        "time": time.time(),
-        "user": config.INITIAL_PROMPT,
-        "bot": "",
-        "platform": config.CHA_CURRENT_PLATFORM_NAME,
-        "model": config.CHA_DEFAULT_MODEL,
-    }
-]
+CURRENT_CHAT_HISTORY = conversation.Conversation(
+    [conversation.new_turn(config.INITIAL_PROMPT)]
+)
 
 # track visited directories for exit display
 VISITED_DIRECTORIES = []
 HISTORY_MODIFIED = False
+# the session's history journal (see journal.HistoryJournal), None when history is not saved
+HISTORY_JOURNAL = None
 
 
 def format_visited_directories(directories):
@@ -268,6 +264,8 @@ def handle_clipboard_copy(chat_history, divider_text="---"):
         pass
     except Exception as e:
         if config.CHA_DEBUG_MODE:
+            import traceback
+
             print(colors.red(f"Error during copy: {traceback.format_exc()}"))
         else:
             print(colors.red(f"Error during copy: {e}"))
@@ -367,27 +365,7 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
     auto_scrape_detection_mode = False
 
-    # openai's o-models don't accept system prompts
-    if len(CURRENT_CHAT_HISTORY) > 1:
-        messages = []
-        if not reasoning_model:
-            # the first item is the initial prompt.
-            if CURRENT_CHAT_HISTORY and CURRENT_CHAT_HISTORY[0].get("user"):
-                messages.append(
-                    {"role": "user", "content": CURRENT_CHAT_HISTORY[0]["user"]}
-                )
-
-        for item in CURRENT_CHAT_HISTORY[1:]:
-            if item.get("user"):
-                messages.append({"role": "user", "content": item["user"]})
-            if item.get("bot"):
-                messages.append({"role": "assistant", "content": item["bot"]})
-    else:
-        messages = (
-            []
-            if reasoning_model
-            else [{"role": "user", "content": config.INITIAL_PROMPT}]
-        )
+    # NOTE: CURRENT_CHAT_HISTORY is the only copy of the chat, the messages sent to a model are built from it per request
     multi_line_input = False
 
     if filepath or content_string:
@@ -427,7 +405,7 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
         else:
             content = content_string
 
-        messages.append({"role": "user", "content": content})
+        turn = CURRENT_CHAT_HISTORY.add_turn(content, model=selected_model)
         single_response = True
 
     else:
@@ -438,6 +416,9 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
     # main loop for chatting
     while True:
+        if HISTORY_MODIFIED and HISTORY_JOURNAL is not None:
+            HISTORY_JOURNAL.sync(CURRENT_CHAT_HISTORY)
+
         if not single_response:
             user_input_string = colors.blue("User: ")
 
@@ -447,6 +428,9 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
             if auto_scrape_detection_mode:
                 user_input_string = colors.yellow("[S] ") + colors.blue("User: ")
 
+            if config.CHA_PREWARM_CONNECTIONS:
+                prewarm_current_chat_client()
+
             message = utils.safe_input(user_input_string).rstrip("\n")
 
             # print help
@@ -466,32 +450,7 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
                 selected_indices = backtrack_history(CURRENT_CHAT_HISTORY)
                 if selected_indices is not None:
-                    original_length = len(CURRENT_CHAT_HISTORY)
-                    selected_indices = sorted(selected_indices, reverse=True)
-
-                    for index in selected_indices:
-                        if 1 <= index < len(CURRENT_CHAT_HISTORY):
-                            CURRENT_CHAT_HISTORY.pop(index)
-
-                    messages.clear()
-                    if not reasoning_model:
-                        if CURRENT_CHAT_HISTORY and CURRENT_CHAT_HISTORY[0].get("user"):
-                            messages.append(
-                                {
-                                    "role": "user",
-                                    "content": CURRENT_CHAT_HISTORY[0]["user"],
-                                }
-                            )
-
-                    for item in CURRENT_CHAT_HISTORY[1:]:
-                        if item.get("user"):
-                            messages.append({"role": "user", "content": item["user"]})
-                        if item.get("bot"):
-                            messages.append(
-                                {"role": "assistant", "content": item["bot"]}
-                            )
-
-                    num_removed = original_length - len(CURRENT_CHAT_HISTORY)
+                    num_removed = CURRENT_CHAT_HISTORY.remove_turns(selected_indices)
                     if num_removed > 0:
                         HISTORY_MODIFIED = True
                         chat_word = "chat" if num_removed == 1 else "chats"
@@ -548,26 +507,6 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     )
                     if history_updated:
                         HISTORY_MODIFIED = True
-                        messages.clear()
-                        if not reasoning_model:
-                            if CURRENT_CHAT_HISTORY and CURRENT_CHAT_HISTORY[0].get(
-                                "user"
-                            ):
-                                messages.append(
-                                    {
-                                        "role": "user",
-                                        "content": CURRENT_CHAT_HISTORY[0]["user"],
-                                    }
-                                )
-                        for item in CURRENT_CHAT_HISTORY[1:]:
-                            if item.get("user"):
-                                messages.append(
-                                    {"role": "user", "content": item["user"]}
-                                )
-                            if item.get("bot"):
-                                messages.append(
-                                    {"role": "assistant", "content": item["bot"]}
-                                )
                 except (KeyboardInterrupt, EOFError):
                     continue
                 except SystemExit:
@@ -592,6 +531,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     print(colors.blue(">"), line)
 
             if message.startswith(config.SWITCH_MODEL_TEXT):
+                from cha import platforms
+
                 parts = message.strip().split(maxsplit=1)
                 if len(parts) == 1:
                     new_selected_model = platforms.list_models()
@@ -613,6 +554,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                 continue
 
             if message.startswith(config.SWITCH_PLATFORM_TEXT):
+                from cha import platforms
+
                 parts = message.strip().split(maxsplit=1)
                 if len(parts) == 1:
                     try:
@@ -627,7 +570,9 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                             if API_KEY_VALUE in os.environ:
                                 API_KEY_VALUE = os.environ.get(API_KEY_NAME)
 
-                            set_current_chat_client(API_KEY_VALUE, BASE_URL_VALUE)
+                            set_current_chat_client(
+                                API_KEY_VALUE, BASE_URL_VALUE, api_key_env=API_KEY_NAME
+                            )
                             config.CHA_CURRENT_PLATFORM_NAME = platform_name
                             reasoning_model = utils.is_slow_model(selected_model)
 
@@ -664,7 +609,9 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                             if API_KEY_VALUE in os.environ:
                                 API_KEY_VALUE = os.environ.get(API_KEY_NAME)
 
-                            set_current_chat_client(API_KEY_VALUE, BASE_URL_VALUE)
+                            set_current_chat_client(
+                                API_KEY_VALUE, BASE_URL_VALUE, api_key_env=API_KEY_NAME
+                            )
                             config.CHA_CURRENT_PLATFORM_NAME = platform_name
                             reasoning_model = utils.is_slow_model(selected_model)
 
@@ -693,7 +640,6 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     if recorded_text:
                         print(colors.blue("User:"), colors.white(recorded_text))
                         message = recorded_text
-                        messages.append({"role": "user", "content": message})
                     else:
                         continue
                 except Exception as e:
@@ -731,14 +677,11 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                 from cha import local
 
                 try:
-                    parts = (
-                        message.strip().lower().split(config.LOAD_HISTORY_TRIGGER, 1)
+                    exact_mode, query = local.parse_history_search_args(
+                        message.strip()[len(config.LOAD_HISTORY_TRIGGER) :]
                     )
-                    search_mode_arg = parts[1].strip() if len(parts) > 1 else "fuzzy"
-                    exact_mode = search_mode_arg == "exact"
-
                     hs_output = local.browse_and_select_history_file(
-                        exact_mode=exact_mode
+                        exact_mode=exact_mode, query=query
                     )
                     if not hs_output or not isinstance(hs_output, dict):
                         continue
@@ -752,23 +695,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     print(colors.magenta(selected_path))
                     local.print_history_browse_and_select_history_file(chat_msgs)
 
-                    CURRENT_CHAT_HISTORY.clear()
-                    CURRENT_CHAT_HISTORY.extend(chat_msgs)
+                    CURRENT_CHAT_HISTORY.replace(chat_msgs)
                     HISTORY_MODIFIED = False
-
-                    messages.clear()
-                    if not reasoning_model:
-                        messages.append(
-                            {"role": "user", "content": config.INITIAL_PROMPT}
-                        )
-
-                    for item in chat_msgs[1:]:
-                        if item.get("user"):
-                            messages.append({"role": "user", "content": item["user"]})
-                        if item.get("bot"):
-                            messages.append(
-                                {"role": "assistant", "content": item["bot"]}
-                            )
                 except (KeyboardInterrupt, EOFError):
                     print()
                 except Exception as e:
@@ -789,11 +717,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                 try:
                     confirmation = input(colors.yellow("Clear History [y/N]? "))
                     if confirmation.lower() == "y":
-                        messages = (
-                            []
-                            if reasoning_model
-                            else [{"role": "user", "content": config.INITIAL_PROMPT}]
-                        )
+                        # NOTE: the cleared chats leave the model's context but are still saved in the history
+                        CURRENT_CHAT_HISTORY.clear_context()
                     else:
                         print(colors.red("Canceled clearing chat history"))
                 except (KeyboardInterrupt, EOFError):
@@ -828,7 +753,9 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
                     tool_call_output = local.execute_tool(
                         tool_data=tool_data,
-                        chat_history=messages,
+                        chat_history=CURRENT_CHAT_HISTORY.messages(
+                            include_initial_prompt=not reasoning_model
+                        ),
                         piped_question=message.replace(alias, "").strip(),
                     )
                     if tool_call_output["error"] != None:
@@ -841,17 +768,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     else:
                         tool_result = tool_call_output["result"]
                         if len(str(tool_result)) > 0:
-                            messages.append(
-                                {"role": "assistant", "content": tool_result}
-                            )
-                            CURRENT_CHAT_HISTORY.append(
-                                {
-                                    "time": time.time(),
-                                    "user": message,
-                                    "bot": tool_result,
-                                    "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                                    "model": selected_model,
-                                }
+                            CURRENT_CHAT_HISTORY.add_turn(
+                                message, bot=tool_result, model=selected_model
                             )
                             HISTORY_MODIFIED = True
                         message = tool_result
@@ -883,7 +801,10 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
                     if message != None:
                         print(colors.green(f"Scraped content added to chat history"))
-                        messages.append({"role": "user", "content": message})
+                        CURRENT_CHAT_HISTORY.add_turn(
+                            message, model=selected_model, pinned=True
+                        )
+                        HISTORY_MODIFIED = True
                     continue
                 else:
                     auto_scrape_detection_mode = not auto_scrape_detection_mode
@@ -1042,15 +963,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     get_current_chat_client(), simple=True
                 )
                 if message != None:
-                    messages.append({"role": "user", "content": message})
-                    CURRENT_CHAT_HISTORY.append(
-                        {
-                            "time": time.time(),
-                            "user": message,
-                            "bot": "",
-                            "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                            "model": selected_model,
-                        }
+                    CURRENT_CHAT_HISTORY.add_turn(
+                        message, model=selected_model, pinned=True
                     )
                     HISTORY_MODIFIED = True
                 continue
@@ -1063,15 +977,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                     get_current_chat_client(), simple=False
                 )
                 if message != None:
-                    messages.append({"role": "user", "content": message})
-                    CURRENT_CHAT_HISTORY.append(
-                        {
-                            "time": time.time(),
-                            "user": message,
-                            "bot": "",
-                            "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                            "model": selected_model,
-                        }
+                    CURRENT_CHAT_HISTORY.add_turn(
+                        message, model=selected_model, pinned=True
                     )
                     HISTORY_MODIFIED = True
                 continue
@@ -1106,15 +1013,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                             )
                             print(colors.magenta(f"{compressed_tokens} Total Tokens"))
 
-                        messages.append({"role": "user", "content": report})
-                        CURRENT_CHAT_HISTORY.append(
-                            {
-                                "time": time.time(),
-                                "user": report,
-                                "bot": "",
-                                "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                                "model": selected_model,
-                            }
+                        CURRENT_CHAT_HISTORY.add_turn(
+                            report, model=selected_model, pinned=True
                         )
                         HISTORY_MODIFIED = True
                     continue
@@ -1137,7 +1037,10 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
 
                     if message != None:
                         print(colors.green(f"Scraped content added to chat history"))
-                        messages.append({"role": "user", "content": message})
+                        CURRENT_CHAT_HISTORY.add_turn(
+                            message, model=selected_model, pinned=True
+                        )
+                        HISTORY_MODIFIED = True
                     continue
 
             # check for quick search command
@@ -1177,16 +1080,8 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                             user_input_mode=True,
                         )
 
-                    messages.append({"role": "user", "content": message})
-
-                    CURRENT_CHAT_HISTORY.append(
-                        {
-                            "time": time.time(),
-                            "user": "",
-                            "bot": message,
-                            "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                            "model": selected_model,
-                        }
+                    CURRENT_CHAT_HISTORY.add_turn(
+                        "", bot=message, model=selected_model, bot_role="user"
                     )
                     HISTORY_MODIFIED = True
                 except (KeyboardInterrupt, EOFError, SystemExit):
@@ -1204,92 +1099,391 @@ def chatbot(selected_model, print_title=True, filepath=None, content_string=None
                 continue
 
             # add user's message
-            messages.append({"role": "user", "content": message})
-
-        # prepare a chat record for local usage
-        obj_chat_history = {
-            "time": time.time(),
-            "user": messages[-1]["content"],
-            "bot": "",
-            "platform": config.CHA_CURRENT_PLATFORM_NAME,
-            "model": selected_model,
-        }
+            turn = CURRENT_CHAT_HISTORY.add_turn(message, model=selected_model)
 
         # attempt to send the user's prompt to the selected model
         try:
-            if reasoning_model:
-                if not output_is_piped:
-                    loading.start_loading("Thinking", "braille")
-                response = get_current_chat_client().chat.completions.create(
-                    model=selected_model, messages=messages
+            from cha import context, metrics
+
+            # one-shot chats go through a running cha --daemon, if there is one
+            daemon_connection = None
+            if single_response and config.CHA_USE_DAEMON:
+                from cha import daemon
+
+                daemon_connection = daemon.connect()
+
+            if daemon_connection is not None:
+                full_response, streamed, cancelled, stats = (
+                    request_daemon_chat_response(
+                        daemon_connection,
+                        selected_model,
+                        output_is_piped,
+                        reasoning_model,
+                    )
                 )
-                if not output_is_piped:
-                    loading.stop_loading()
-                full_response = response.choices[0].message.content
-                if output_is_piped:
-                    print(full_response)
-                else:
-                    print(colors.green(full_response))
-                obj_chat_history["bot"] = full_response
-
             else:
-                response = get_current_chat_client().chat.completions.create(
-                    model=selected_model, messages=messages, stream=True
+                messages, context_report = context.build_messages(
+                    CURRENT_CHAT_HISTORY,
+                    selected_model,
+                    include_initial_prompt=not reasoning_model,
+                    quiet=output_is_piped,
                 )
-                full_response = ""
-                try:
-                    error_count = 0
-                    for chunk in response:
-                        try:
-                            chunk_message = chunk.choices[0].delta.content
-                        except:
-                            error_count += 1
-                            if error_count > config.CHA_STREAMING_ERROR_LIMIT:
-                                break
-                            pass
-                        if chunk_message:
-                            if output_is_piped:
-                                sys.stdout.write(chunk_message)
-                            else:
-                                sys.stdout.write(colors.green(chunk_message))
-                            full_response += chunk_message
-                            obj_chat_history["bot"] += chunk_message
-                            sys.stdout.flush()
-                except (KeyboardInterrupt, EOFError):
-                    full_response += " [cancelled]"
-                    obj_chat_history["bot"] += " [cancelled]"
+                full_response, streamed, cancelled, stats = request_chat_response(
+                    selected_model, messages, output_is_piped, reasoning_model
+                )
+            if cancelled:
+                full_response += " [cancelled]"
+            turn["bot"] = full_response
+            turn["metrics"] = metrics.turn_metrics(
+                stats, full_response, selected_model, streamed=streamed
+            )
 
-            if full_response:
-                messages.append({"role": "assistant", "content": full_response})
-                if (
-                    not reasoning_model
-                    and not full_response.endswith("\n")
-                    and not output_is_piped
-                ):
-                    sys.stdout.write("\n")
-                    sys.stdout.flush()
+            if (
+                full_response
+                and streamed
+                and not full_response.endswith("\n")
+                and not output_is_piped
+            ):
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            if config.CHA_SHOW_TURN_USAGE and not output_is_piped:
+                print(colors.magenta(format_turn_usage(stats)))
 
         except (KeyboardInterrupt, EOFError):
             if not output_is_piped:
                 loading.stop_loading()
-            if messages and messages[-1]["role"] == "user":
-                messages.pop()
+            CURRENT_CHAT_HISTORY.discard_turn(turn)
+            if single_response:
+                break
             continue
         except Exception as e:
             if not output_is_piped:
                 loading.stop_loading()
                 print(colors.red(f"Error during chat: {e}"))
+            CURRENT_CHAT_HISTORY.discard_turn(turn)
             break
 
-        CURRENT_CHAT_HISTORY.append(obj_chat_history)
         HISTORY_MODIFIED = True
 
         if single_response:
             break
 
 
+# (platform, model) pairs whose api refused a streamed completion, they get a blocking call from then on
+NON_STREAMING_MODELS = set()
+# (platform, model) pairs whose api refused stream_options, they are streamed without usage
+NO_STREAM_USAGE_MODELS = set()
+# NOTE: both sets are kept next to the model catalogs so a new launch does not pay for the refused request again
+STREAM_SUPPORT_FILE = os.path.join(
+    config.LOCAL_CHA_CONFIG_CACHE_DIR, "models", "_stream_support.json"
+)
+_stream_support_loaded = False
+
+
+def _load_stream_support():
+    global _stream_support_loaded
+    if _stream_support_loaded:
+        return
+    _stream_support_loaded = True
+    if not config.CHA_USE_MODEL_CATALOG_CACHE:
+        return
+    try:
+        with open(STREAM_SUPPORT_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        NON_STREAMING_MODELS.update(tuple(key) for key in data["non_streaming"])
+        NO_STREAM_USAGE_MODELS.update(tuple(key) for key in data["no_stream_usage"])
+    except:
+        pass
+
+
+def _save_stream_support():
+    if not utils.local_cache_enabled(config.CHA_USE_MODEL_CATALOG_CACHE):
+        return
+    try:
+        os.makedirs(os.path.dirname(STREAM_SUPPORT_FILE), exist_ok=True)
+        utils.write_json_atomic(
+            STREAM_SUPPORT_FILE,
+            {
+                "non_streaming": sorted(NON_STREAMING_MODELS),
+                "no_stream_usage": sorted(NO_STREAM_USAGE_MODELS),
+            },
+            indent=4,
+        )
+    except:
+        pass
+
+
+def _delta_reasoning(delta):
+    # platforms expose reasoning deltas under different names (e.g. deepseek uses "reasoning_content")
+    for field in ("reasoning_content", "reasoning"):
+        value = getattr(delta, field, None)
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) if details else None
+    if cached_tokens is None:
+        # anthropic style usage, returned by some compatible apis
+        cached_tokens = getattr(usage, "cache_read_input_tokens", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "cached_tokens": cached_tokens or 0,
+    }
+
+
+def _render_chat_stream(response, output_is_piped, reasoning_model, stats):
+    # prints the answer as it arrives (and reasoning deltas, if shown), returns (full_response, cancelled)
+    show_reasoning = config.CHA_SHOW_REASONING and not output_is_piped
+    renderer = stream.StreamRenderer(style=None if output_is_piped else colors.green)
+    reasoning_renderer = None
+    waiting_for_output = reasoning_model and not output_is_piped
+    cancelled = False
+    try:
+        error_count = 0
+        for chunk in response:
+            stats["chunks"] += 1
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                stats["usage"] = _usage_dict(usage)
+            # NOTE: with include_usage the last chunk carries the usage and no choices
+            if usage is not None and not getattr(chunk, "choices", None):
+                continue
+
+            try:
+                delta = chunk.choices[0].delta
+            except:
+                error_count += 1
+                if error_count > config.CHA_STREAMING_ERROR_LIMIT:
+                    break
+                continue
+
+            reasoning = _delta_reasoning(delta) if show_reasoning else None
+            if reasoning:
+                if waiting_for_output:
+                    loading.stop_loading()
+                    waiting_for_output = False
+                if reasoning_renderer is None:
+                    reasoning_renderer = stream.StreamRenderer(style=colors.magenta)
+                reasoning_renderer.write(reasoning)
+
+            content = getattr(delta, "content", None)
+            if content:
+                if stats["first_token"] is None:
+                    stats["first_token"] = time.time()
+                if waiting_for_output:
+                    loading.stop_loading()
+                    waiting_for_output = False
+                if (
+                    reasoning_renderer is not None
+                    and not reasoning_renderer.closed.is_set()
+                ):
+                    reasoning_renderer.close()
+                    sys.stdout.write("\n\n")
+                renderer.write(content)
+    except (KeyboardInterrupt, EOFError):
+        cancelled = True
+    finally:
+        if waiting_for_output:
+            loading.stop_loading()
+        if reasoning_renderer is not None:
+            reasoning_renderer.close()
+        full_response = renderer.close()
+        stats["finished"] = time.time()
+    return full_response, cancelled
+
+
+def new_request_stats():
+    return {
+        "started": time.time(),
+        "first_token": None,
+        "finished": None,
+        "chunks": 0,
+        "usage": None,
+        "retries": 0,
+    }
+
+
+def _is_unsupported_param_error(error, param):
+    """
+    True if the api rejected the request (a 400) because of the given parameter,
+    by its param field or by naming it as unsupported. Server, gateway (e.g. an
+    "upstream" 502), network, and rate limit errors never match.
+    """
+    from openai import BadRequestError
+
+    if not isinstance(error, BadRequestError):
+        return False
+    if getattr(error, "param", None) == param:
+        return True
+    message = str(getattr(error, "message", None) or error).lower()
+    if not re.search(rf"(?<![\w.]){re.escape(param)}(?![\w.])", message):
+        return False
+    return any(
+        phrase in message
+        for phrase in (
+            "not supported",
+            "unsupported",
+            "does not support",
+            "not allowed",
+            "not permitted",
+            "unrecognized",
+            "unknown",
+            "extra",
+            "invalid",
+        )
+    )
+
+
+def open_chat_completion(
+    selected_model, messages, stats, client=None, platform_name=None
+):
+    """
+    Sends the chat to the model, returns (response, streamed). The response is a
+    stream of chunks unless the (platform, model) pair refused a streamed request
+    once, those are remembered in NON_STREAMING_MODELS and get a blocking call.
+    Every retry is counted in stats.
+    """
+    _load_stream_support()
+    client = client or get_current_chat_client()
+    model_key = (platform_name or config.CHA_CURRENT_PLATFORM_NAME, selected_model)
+    # NOTE: the clock starts here, importing openai and building the client are not part of the request
+    stats["started"] = time.time()
+    if model_key not in NON_STREAMING_MODELS:
+        request = {"model": selected_model, "messages": messages, "stream": True}
+        if model_key not in NO_STREAM_USAGE_MODELS:
+            request["stream_options"] = {"include_usage": True}
+        try:
+            try:
+                return client.chat.completions.create(**request), True
+            except Exception as e:
+                # some openai compatible apis reject stream_options, stream without usage then
+                if "stream_options" not in request or not _is_unsupported_param_error(
+                    e, "stream_options"
+                ):
+                    raise
+                NO_STREAM_USAGE_MODELS.add(model_key)
+                _save_stream_support()
+                del request["stream_options"]
+                stats["retries"] += 1
+                return client.chat.completions.create(**request), True
+        except Exception as e:
+            # NOTE: only a refusal to stream is handled here, any other error goes to the caller
+            if not _is_unsupported_param_error(e, "stream"):
+                raise
+            NON_STREAMING_MODELS.add(model_key)
+            _save_stream_support()
+            stats["retries"] += 1
+
+    return (
+        client.chat.completions.create(model=selected_model, messages=messages),
+        False,
+    )
+
+
+def request_chat_response(selected_model, messages, output_is_piped, reasoning_model):
+    """
+    Sends the chat to the model and prints the answer, returns (full_response,
+    streamed, cancelled, stats). Every model is streamed, reasoning models included,
+    except the ones open_chat_completion falls back to a blocking call for. stats
+    holds the request's timings, chunk count, and token usage (if returned).
+    """
+    stats = new_request_stats()
+    _load_stream_support()
+    model_key = (config.CHA_CURRENT_PLATFORM_NAME, selected_model)
+    show_loading = not output_is_piped and (
+        reasoning_model or model_key in NON_STREAMING_MODELS
+    )
+    if show_loading:
+        loading.start_loading("Thinking", "braille")
+    try:
+        response, streamed = open_chat_completion(selected_model, messages, stats)
+    except:
+        if show_loading:
+            loading.stop_loading()
+        raise
+
+    if streamed:
+        full_response, cancelled = _render_chat_stream(
+            response, output_is_piped, reasoning_model, stats
+        )
+        return full_response, True, cancelled, stats
+
+    if show_loading:
+        loading.stop_loading()
+    stats["first_token"] = stats["finished"] = time.time()
+    stats["chunks"] = 1
+    stats["usage"] = _usage_dict(getattr(response, "usage", None))
+    full_response = response.choices[0].message.content
+    if output_is_piped:
+        print(full_response)
+    else:
+        print(colors.green(full_response))
+    return full_response, False, False, stats
+
+
+def request_daemon_chat_response(
+    connection, selected_model, output_is_piped, reasoning_model
+):
+    """
+    request_chat_response through a cha --daemon, which builds the messages from
+    CURRENT_CHAT_HISTORY and makes the request with its warm client, the answer is
+    printed here as it streams back.
+    """
+    from cha import daemon
+
+    stats = new_request_stats()
+    result = {}
+    if reasoning_model and not output_is_piped:
+        loading.start_loading("Thinking", "braille")
+    try:
+        chunks = daemon.chat_chunks(
+            connection,
+            CURRENT_CHAT_HISTORY,
+            selected_model,
+            include_initial_prompt=not reasoning_model,
+            quiet=output_is_piped,
+            result=result,
+        )
+        full_response, cancelled = _render_chat_stream(
+            chunks, output_is_piped, reasoning_model, stats
+        )
+    finally:
+        # NOTE: closing the connection also stops the daemon's request when cancelled
+        connection.close()
+    stats["retries"] = result.get("retries", 0)
+    # the daemon's clock, it started right before its api request
+    stats["started"] = result.get("started", stats["started"])
+    return full_response, result.get("streamed", True), cancelled, stats
+
+
+def format_turn_usage(stats):
+    parts = []
+    usage = stats.get("usage")
+    if usage:
+        cached = usage["cached_tokens"]
+        uncached = max(usage["prompt_tokens"] - cached, 0)
+        parts.append(
+            f"{usage['prompt_tokens']:,} prompt tokens "
+            f"({cached:,} cached, {uncached:,} uncached)"
+        )
+        parts.append(f"{usage['completion_tokens']:,} completion tokens")
+    else:
+        parts.append("no usage returned")
+    if stats.get("first_token"):
+        parts.append(f"first token {stats['first_token'] - stats['started']:.2f}s")
+    if stats.get("finished"):
+        parts.append(f"total {stats['finished'] - stats['started']:.2f}s")
+    return ", ".join(parts)
+
+
 def cli():
-    global CURRENT_CHAT_HISTORY, HISTORY_MODIFIED
+    global CURRENT_CHAT_HISTORY, HISTORY_MODIFIED, HISTORY_JOURNAL
 
     save_chat_state = True
     args = None
@@ -1366,8 +1560,7 @@ def cli():
             dest="history_search",
             nargs="?",
             const="fuzzy",
-            choices=["fuzzy", "exact"],
-            help="Search history. 'fuzzy' (default), 'exact' for exact. (interactive: !hs)",
+            help="Search history: [fuzzy|exact] [query], 'fuzzy' is the default. The query takes model:, platform:, since:, and until: filters (interactive: !hs)",
         )
         parser.add_argument(
             "-r",
@@ -1397,6 +1590,12 @@ def cli():
             action="store_true",
             help="Select a model from a list",
         )
+        parser.add_argument(
+            "--refresh-models",
+            dest="refresh_models",
+            action="store_true",
+            help="Refetch the model lists of the platforms instead of using the cached ones",
+        )
         parser.add_argument(
             "-ct",
             "--tokens",
@@ -1437,6 +1636,19 @@ def cli():
             dest="version",
             help="Show version information",
         )
+        parser.add_argument(
+            "--daemon",
+            nargs="?",
+            const="start",
+            choices=["start", "stop", "status"],
+            help="Run a background daemon that answers one-shot chats with warm clients (start, stop, or status)",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            dest="stats",
+            help="Show latency and token stats per platform and model from the saved chat history",
+        )
         parser.add_argument(
             "-lh",
             "--load-history",
@@ -1451,6 +1663,25 @@ def cli():
 
         args = parser.parse_args()
 
+        if args.daemon:
+            from cha import daemon
+
+            {"start": daemon.serve, "stop": daemon.stop, "status": daemon.status}[
+                args.daemon
+            ]()
+            return
+
+        if args.refresh_models:
+            from cha import platforms
+
+            platforms.force_catalog_refresh()
+
+        if not args.private and config.CHA_LOCAL_SAVE_ALL_CHA_CHATS == True:
+            from cha import journal
+
+            if journal.is_enabled():
+                journal.recover_orphaned_journals(quiet=not sys.stdout.isatty())
+
         if args.continue_chat:
             history_dir = config.LOCAL_CHA_CONFIG_HISTORY_DIR
             if not os.path.isdir(history_dir):
@@ -1487,8 +1718,7 @@ def cli():
                         f"Invalid history format in {os.path.basename(history_file_path)}"
                     )
 
-                CURRENT_CHAT_HISTORY.clear()
-                CURRENT_CHAT_HISTORY.extend(chat_history)
+                CURRENT_CHAT_HISTORY.replace(chat_history)
                 HISTORY_MODIFIED = False
 
                 from cha import local
@@ -1530,18 +1760,11 @@ def cli():
                             "Invalid history format: must be a list of objects"
                         )
 
-                    CURRENT_CHAT_HISTORY.clear()
-                    CURRENT_CHAT_HISTORY.extend(chat_history)
+                    CURRENT_CHAT_HISTORY.replace(chat_history)
                     HISTORY_MODIFIED = False
                     if not CURRENT_CHAT_HISTORY:
                         CURRENT_CHAT_HISTORY.append(
-                            {
-                                "time": time.time(),
-                                "user": config.INITIAL_PROMPT,
-                                "bot": "",
-                                "platform": config.CHA_CURRENT_PLATFORM_NAME,
-                                "model": config.CHA_DEFAULT_MODEL,
-                            }
+                            conversation.new_turn(config.INITIAL_PROMPT)
                         )
 
                     from cha import local
@@ -1589,12 +1812,19 @@ def cli():
                 )
             return
 
+        if args.stats:
+            from cha import metrics
+
+            metrics.print_stats_report()
+            return
+
         if args.history_search:
             try:
                 from cha import local
 
+                exact_mode, query = local.parse_history_search_args(args.history_search)
                 hs_output = local.browse_and_select_history_file(
-                    exact_mode=(args.history_search == "exact")
+                    exact_mode=exact_mode, query=query
                 )
                 if hs_output and isinstance(hs_output, dict):
                     selected_path = hs_output.get("path")
@@ -1625,6 +1855,12 @@ def cli():
         if args.private:
             save_chat_state = False
 
+        if save_chat_state and config.CHA_LOCAL_SAVE_ALL_CHA_CHATS == True:
+            from cha import journal
+
+            if journal.is_enabled():
+                HISTORY_JOURNAL = journal.HistoryJournal(args=vars(args))
+
         if args.code_dump:
             from cha import codedump
 
@@ -1672,21 +1908,37 @@ def cli():
                 output_to_stdout = "stdout" in options
                 compress_output = "compress" in options
 
-                # call codedump to get the content
+                if not compress_output:
+                    # NOTE: the dump is written out file by file, it is never held in memory as a whole
+                    if output_to_stdout:
+                        codedump.code_dump(
+                            auto_include_all=auto_include_all,
+                            specific_includes=specific_includes,
+                            quiet=not sys.stdout.isatty(),
+                            output=sys.stdout,
+                        )
+                    else:
+                        codedump.code_dump(
+                            save_file_to_current_dir=True,
+                            auto_include_all=auto_include_all,
+                            specific_includes=specific_includes,
+                        )
+                    return
+
+                # compressing needs the whole dump, so it is built in memory
                 content, token_count = codedump.code_dump(
-                    output_to_stdout=True,  # always get content back
+                    output_to_stdout=True,
                     auto_include_all=auto_include_all,
                     specific_includes=specific_includes,
                 )
 
                 if content:
-                    if compress_output:
-                        content = utils.simple_context_compression(
-                            content, remove_comments=True
-                        )
-                        compressed_tokens = utils.count_tokens(content, args.model)
-                        if sys.stdout.isatty():
-                            print(colors.magenta(f"{compressed_tokens} Total Tokens"))
+                    content = utils.simple_context_compression(
+                        content, remove_comments=True
+                    )
+                    compressed_tokens = utils.count_tokens(content, args.model)
+                    if sys.stdout.isatty():
+                        print(colors.magenta(f"{compressed_tokens} Total Tokens"))
 
                     if output_to_stdout:
                         print(content)
@@ -1771,6 +2023,8 @@ def cli():
             if not platform_arg and config.CHA_CURRENT_PLATFORM_NAME != "openai":
                 platform_arg = config.CHA_CURRENT_PLATFORM_NAME
 
+            from cha import platforms
+
             try:
                 API_KEY_NAME = None
                 BASE_URL_VALUE = None
@@ -1817,7 +2071,9 @@ def cli():
                     )
 
                 API_KEY_VALUE = os.environ.get(API_KEY_NAME, API_KEY_NAME)
-                set_current_chat_client(API_KEY_VALUE, BASE_URL_VALUE)
+                set_current_chat_client(
+                    API_KEY_VALUE, BASE_URL_VALUE, api_key_env=API_KEY_NAME
+                )
 
                 if not platform_name:
                     for p_name, p_data in config.THIRD_PARTY_PLATFORMS.items():
@@ -1840,6 +2096,8 @@ def cli():
                 raise Exception(f"Failed to switch platform due to {e}")
 
         if args.select_model:
+            from cha import platforms
+
             new_selected_model = platforms.list_models()
             if new_selected_model:
                 selected_model = new_selected_model
@@ -1964,6 +2222,8 @@ def cli():
     except Exception as err:
         if sys.stdout.isatty():
             if config.CHA_DEBUG_MODE:
+                import traceback
+
                 print(colors.red(str(traceback.format_exc())))
             elif str(err):
                 err_msg = f"{err}"
@@ -1986,42 +2246,20 @@ def cli():
             and os.path.exists(config.LOCAL_CHA_CONFIG_HISTORY_DIR)
             and HISTORY_MODIFIED
         ):
-            from datetime import datetime, timezone
-            from importlib.metadata import version
-            import uuid
+            from cha import journal
 
-            try:
-                version_id = str(version("cha"))
-            except:
-                version_id = "?"
-
-            epoch_time_seconds = time.time()
-            utc_time_stamp = f"{datetime.now(timezone.utc)} UTC"
-            file_id = str(uuid.uuid4())
-
-            history_save = {
-                "chat": CURRENT_CHAT_HISTORY,
-                "id": file_id,
-                "version": version_id,
-                "date": {
-                    "epoch": {"seconds": epoch_time_seconds},
-                    "utc": utc_time_stamp,
-                },
-                "args": {},
-                "config": utils.get_json_serializable_globals(config),
-            }
-
-            if args != None:
-                history_save["args"] = vars(args)
-
-            file_path = os.path.join(
-                config.LOCAL_CHA_CONFIG_HISTORY_DIR,
-                f"cha_hs_{int(epoch_time_seconds)}.json",
+            history_save = journal.history_save_data(
+                CURRENT_CHAT_HISTORY, args=vars(args) if args != None else {}
             )
+            journal.write_history_file(history_save)
 
-            utils.write_json(file_path, history_save)
+        # NOTE: the chat is saved (or had nothing new), the journal was only needed in case of a crash
+        if HISTORY_JOURNAL is not None:
+            HISTORY_JOURNAL.close(remove=True)
     except Exception as e:
         if config.CHA_DEBUG_MODE:
+            import traceback
+
             print(colors.red(str(traceback.format_exc())))
         else:
             print(colors.red(f"Unexpected error well handling local logic: {str(e)}"))
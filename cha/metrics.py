@@ -0,0 +1,170 @@
+import statistics
+import glob
+import json
+import time
+import os
+
+from cha import colors, utils, config
+
+
+def turn_metrics(stats, response_text, model_name, streamed=True):
+    """
+    Turns a request's raw stats (see main.request_chat_response) into the metrics
+    saved with each chat turn. Without usage from the api, the completion tokens
+    are counted locally and usage_reported is False.
+    """
+    started = stats["started"]
+    first_token = stats.get("first_token")
+    finished = stats.get("finished") or time.time()
+    usage = stats.get("usage") or {}
+
+    completion_tokens = usage.get("completion_tokens")
+    if not completion_tokens and response_text:
+        completion_tokens = utils.count_tokens(response_text, model_name)
+        if completion_tokens is None:
+            completion_tokens = utils.count_tokens(
+                response_text, model_name, fast_mode=True
+            )
+
+    stream_seconds = finished - (first_token or started)
+    tokens_per_second = None
+    if completion_tokens and stream_seconds > 0:
+        tokens_per_second = round(completion_tokens / stream_seconds, 1)
+
+    return {
+        "request_start": round(started, 3),
+        "time_to_first_token": (
+            round(first_token - started, 3) if first_token is not None else None
+        ),
+        "stream_seconds": round(stream_seconds, 3),
+        "total_seconds": round(finished - started, 3),
+        "chunks": stats.get("chunks", 0),
+        "tokens_per_second": tokens_per_second,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "cached_tokens": usage.get("cached_tokens"),
+        "completion_tokens": completion_tokens,
+        "usage_reported": bool(usage),
+        "retries": stats.get("retries", 0),
+        "streamed": streamed,
+    }
+
+
+def iter_history_turns(history_dir=None):
+    # yields every saved turn that has metrics, from every history file
+    history_dir = history_dir or config.LOCAL_CHA_CONFIG_HISTORY_DIR
+    for path in glob.glob(os.path.join(history_dir, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except:
+            continue
+        chat = data.get("chat") if isinstance(data, dict) else data
+        if not isinstance(chat, list):
+            continue
+        for turn in chat:
+            if isinstance(turn, dict) and isinstance(turn.get("metrics"), dict):
+                yield turn
+
+
+def _values(metrics, key):
+    return [m[key] for m in metrics if isinstance(m.get(key), (int, float))]
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def aggregate_metrics(turns):
+    """
+    Groups the turns' metrics by (platform, model) and summarizes each group with
+    the p50/p90 time to first token, the p50 tokens/sec, the p50 total time, token
+    totals, the share of cached prompt tokens, and the retry count.
+    """
+    groups = {}
+    for turn in turns:
+        key = (turn.get("platform") or "unknown", turn.get("model") or "unknown")
+        groups.setdefault(key, []).append(turn["metrics"])
+
+    rows = []
+    for (platform, model), metrics in groups.items():
+        ttft = _values(metrics, "time_to_first_token")
+        speed = _values(metrics, "tokens_per_second")
+        total = _values(metrics, "total_seconds")
+        prompt_tokens = sum(m.get("prompt_tokens") or 0 for m in metrics)
+        cached_tokens = sum(m.get("cached_tokens") or 0 for m in metrics)
+        rows.append(
+            {
+                "platform": platform,
+                "model": model,
+                "turns": len(metrics),
+                "ttft_p50": statistics.median(ttft) if ttft else None,
+                "ttft_p90": _percentile(ttft, 90) if ttft else None,
+                "tokens_per_second_p50": statistics.median(speed) if speed else None,
+                "total_seconds_p50": statistics.median(total) if total else None,
+                "prompt_tokens": prompt_tokens,
+                "cached_ratio": (
+                    cached_tokens / prompt_tokens if prompt_tokens else None
+                ),
+                "completion_tokens": sum(
+                    m.get("completion_tokens") or 0 for m in metrics
+                ),
+                "retries": sum(m.get("retries") or 0 for m in metrics),
+            }
+        )
+
+    # the fastest (highest p50 tokens/sec) first
+    rows.sort(key=lambda row: -(row["tokens_per_second_p50"] or 0))
+    return rows
+
+
+def _format_seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def print_stats_report(history_dir=None):
+    rows = aggregate_metrics(iter_history_turns(history_dir))
+    if not rows:
+        print(colors.yellow("No turn metrics found in the saved chat history"))
+        return
+
+    header = [
+        "platform",
+        "model",
+        "turns",
+        "ttft p50",
+        "ttft p90",
+        "tok/s p50",
+        "total p50",
+        "prompt tok",
+        "cached",
+        "completion tok",
+        "retries",
+    ]
+    table = [header]
+    for row in rows:
+        table.append(
+            [
+                row["platform"],
+                row["model"],
+                str(row["turns"]),
+                _format_seconds(row["ttft_p50"]),
+                _format_seconds(row["ttft_p90"]),
+                (
+                    "-"
+                    if row["tokens_per_second_p50"] is None
+                    else f"{row['tokens_per_second_p50']:.1f}"
+                ),
+                _format_seconds(row["total_seconds_p50"]),
+                f"{row['prompt_tokens']:,}",
+                "-" if row["cached_ratio"] is None else f"{row['cached_ratio']:.0%}",
+                f"{row['completion_tokens']:,}",
+                str(row["retries"]),
+            ]
+        )
+
+    widths = [max(len(line[i]) for line in table) for i in range(len(header))]
+    for index, line in enumerate(table):
+        text = "  ".join(cell.ljust(width) for cell, width in zip(line, widths))
+        print(colors.magenta(text) if index == 0 else text.rstrip())
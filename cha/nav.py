@@ -1,7 +1,7 @@
 import subprocess
 import os
 
-from cha import colors, config
+from cha import colors, config, walk
 
 
 def fzf_directory_navigation(target_dir=None):
@@ -21,14 +21,8 @@ def fzf_directory_navigation(target_dir=None):
         while True:
             # get directories in current directory
             try:
-                entries = []
-                for entry in os.listdir(current_dir):
-                    entry_path = os.path.join(current_dir, entry)
-                    if os.path.isdir(entry_path):
-                        entries.append(entry)
-
-                # sort directories
-                entries.sort()
+                # sorted directories, scandir avoids a stat call per entry
+                entries = walk.list_dirs(current_dir)
 
                 # if no subdirectories, go directly to final selection
                 if not entries:
@@ -1,42 +1,170 @@
+from urllib.parse import urlparse
 import subprocess
+import threading
+import time
+import json
 import copy
+import os
 
 from cha import utils, config, colors, loading
 from cha.client import get_current_chat_client
 
+# NOTE: the model catalog is cached on disk per platform, see get_model_catalog
+_refreshing_catalogs = set()
+_refreshing_catalogs_lock = threading.Lock()
+# set by cha --refresh-models, every platform's catalog is refetched once when it is next opened
+_force_catalog_refresh = False
+_refetched_catalogs = set()
 
-def list_models():
-    if config.CHA_CURRENT_PLATFORM_NAME == "openai":
-        response = get_current_chat_client().models.list()
-        if not response.data:
-            raise ValueError("No models available")
-
-        models = []
-        for model in response.data:
-            if (
-                any(substr in model.id for substr in config.OPENAI_MODELS_TO_KEEP)
-                and not any(
-                    substr in model.id for substr in config.OPENAI_MODELS_TO_IGNORE
-                )
-                and (
-                    not getattr(config, "OPENAI_IGNORE_DATED_MODEL_NAMES", False)
-                    or not utils.contains_date(model.id)
-                )
-            ):
-                models.append([model.id, model.created])
 
-        models = sorted(models, key=lambda x: x[1])
-        provided_models = []
-        for model in models:
-            provided_models.append(model[0])
-    else:
-        platform_config = config.THIRD_PARTY_PLATFORMS[config.CHA_CURRENT_PLATFORM_NAME]
-        provided_models = get_platform_model_list(
-            url=platform_config["models"]["url"],
-            headers=platform_config["models"]["headers"],
-            models_info=platform_config["models"],
+def _catalog_path(platform_name):
+    return os.path.join(
+        config.LOCAL_CHA_CONFIG_CACHE_DIR, "models", f"{platform_name}.json"
+    )
+
+
+def _catalog_source(platform_name):
+    # a catalog is only valid for the endpoint it was fetched from
+    if platform_name == "openai":
+        return "openai"
+    return config.THIRD_PARTY_PLATFORMS[platform_name]["models"]["url"]
+
+
+def _is_local_platform(platform_name):
+    if platform_name == "openai":
+        return False
+    host = urlparse(_catalog_source(platform_name)).hostname or ""
+    return host in ("localhost", "0.0.0.0", "::1") or host.startswith("127.")
+
+
+def force_catalog_refresh():
+    global _force_catalog_refresh
+    _force_catalog_refresh = True
+
+
+def _read_catalog(platform_name):
+    if not config.CHA_USE_MODEL_CATALOG_CACHE:
+        return None
+    try:
+        with open(_catalog_path(platform_name), "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+        if catalog.get("source") == _catalog_source(platform_name):
+            return catalog
+    except:
+        pass
+    return None
+
+
+def _write_catalog(platform_name, models):
+    if not utils.local_cache_enabled(config.CHA_USE_MODEL_CATALOG_CACHE):
+        return
+    try:
+        path = _catalog_path(platform_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        utils.write_json_atomic(
+            path,
+            {
+                "source": _catalog_source(platform_name),
+                "fetched": time.time(),
+                "models": models,
+            },
+            indent=4,
         )
+    except:
+        pass
+
+
+def _fetch_models(platform_name, client=None):
+    if platform_name == "openai":
+        # NOTE: saved unfiltered, so changing the OPENAI_MODELS_* config applies without a refetch
+        response = (client or get_current_chat_client()).models.list()
+        return [[model.id, model.created] for model in response.data]
 
+    models_info = config.THIRD_PARTY_PLATFORMS[platform_name]["models"]
+    return get_platform_model_list(
+        url=models_info["url"],
+        headers=models_info["headers"],
+        models_info=models_info,
+    )
+
+
+def _refresh_catalog(platform_name, client):
+    try:
+        _write_catalog(platform_name, _fetch_models(platform_name, client))
+    except:
+        pass
+    finally:
+        with _refreshing_catalogs_lock:
+            _refreshing_catalogs.discard(platform_name)
+
+
+def _openai_model_names(models):
+    kept = []
+    for model_id, created in models:
+        if (
+            any(substr in model_id for substr in config.OPENAI_MODELS_TO_KEEP)
+            and not any(substr in model_id for substr in config.OPENAI_MODELS_TO_IGNORE)
+            and (
+                not getattr(config, "OPENAI_IGNORE_DATED_MODEL_NAMES", False)
+                or not utils.contains_date(model_id)
+            )
+        ):
+            kept.append([model_id, created])
+    return [model_id for model_id, _ in sorted(kept, key=lambda x: x[1])]
+
+
+def get_model_catalog(platform_name=None):
+    """
+    Returns the platform's model names. A cached catalog (~/.cha/cache/models/) is
+    returned right away, and if it is older than CHA_MODEL_CATALOG_TTL_SECONDS it
+    is refreshed in a background thread so the next call gets the new list. Only
+    without a catalog does this wait for the api, and a stale catalog keeps
+    working offline. A platform on this machine (e.g. ollama) is refetched right
+    away once its catalog is older than CHA_LOCAL_MODEL_CATALOG_TTL_SECONDS, as is
+    every platform once after cha --refresh-models.
+    """
+    platform_name = platform_name or config.CHA_CURRENT_PLATFORM_NAME
+    catalog = _read_catalog(platform_name)
+    age = time.time() - catalog["fetched"] if catalog is not None else None
+
+    refetch = catalog is None
+    if _force_catalog_refresh and platform_name not in _refetched_catalogs:
+        _refetched_catalogs.add(platform_name)
+        refetch = True
+    elif catalog is not None and _is_local_platform(platform_name):
+        refetch = age > config.CHA_LOCAL_MODEL_CATALOG_TTL_SECONDS
+
+    if refetch:
+        try:
+            models = _fetch_models(platform_name)
+            _write_catalog(platform_name, models)
+        except:
+            # NOTE: e.g. ollama is not running, the last known catalog is better than nothing
+            if catalog is None:
+                raise
+            models = catalog["models"]
+    else:
+        models = catalog["models"]
+        if age > config.CHA_MODEL_CATALOG_TTL_SECONDS:
+            with _refreshing_catalogs_lock:
+                refresh = platform_name not in _refreshing_catalogs
+                _refreshing_catalogs.add(platform_name)
+            if refresh:
+                # NOTE: the client is picked here, the user may switch platforms before the thread runs
+                client = (
+                    get_current_chat_client() if platform_name == "openai" else None
+                )
+                threading.Thread(
+                    target=_refresh_catalog, args=(platform_name, client), daemon=True
+                ).start()
+
+    if platform_name == "openai":
+        return _openai_model_names(models)
+    return models
+
+
+def list_models():
+    provided_models = get_model_catalog(config.CHA_CURRENT_PLATFORM_NAME)
     if not provided_models:
         print(colors.red("No models available to select"))
         return None
@@ -71,7 +199,8 @@ def get_platform_model_list(url, headers, models_info):
 
     if isinstance(content_data, dict):
         dict_path = json_name_path.split(".")
-        tmp = copy.deepcopy(content_data)
+        # NOTE: only read, so the parsed response is walked in place
+        tmp = content_data
         model_name_key = None
         if len(dict_path) > 1:
             for i in range(len(dict_path)):
@@ -137,23 +266,14 @@ def auto_select_a_platform(platform_key=None, model_name=None):
         }
 
     config.CHA_CURRENT_PLATFORM_NAME = platform_key
-    selected_platform = config.THIRD_PARTY_PLATFORMS[platform_key]
 
     models_list = []
     final_model = model_name
     if model_name is None:
-        models_info = selected_platform["models"]
-        url = models_info["url"]
-        headers = models_info["headers"]
-
         failed_to_get_models = False
         try:
             loading.start_loading("Getting Model Names", "dots")
-            models_list = get_platform_model_list(
-                url=url,
-                headers=headers,
-                models_info=models_info,
-            )
+            models_list = get_model_catalog(platform_key)
         except Exception as e:
             loading.print_message(colors.red(f"Failed to retrieve model: {e}"))
             failed_to_get_models = True
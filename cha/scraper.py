@@ -1,16 +1,18 @@
+from urllib.parse import urlparse
 from itertools import islice
 import concurrent.futures
 import subprocess
+import threading
 import tempfile
-import string
+import queue
+import time
 import json
 import re
 import os
 
 from youtube_comment_downloader import *
-from bs4 import BeautifulSoup
 
-from cha import colors, utils, loading, config
+from cha import colors, utils, loading, config, cache, extract
 
 
 def clean_yt_dlp_transcript(input_text):
@@ -164,14 +166,7 @@ def extract_urls(text):
 
 
 def remove_html(content):
-    oline = content
-    soup = BeautifulSoup(oline, "html.parser")
-    for data in soup(["style", "script"]):
-        data.decompose()
-    tmp = " ".join(soup.stripped_strings)
-    tmp = "".join(filter(lambda x: x in set(string.printable), tmp))
-    tmp = re.sub(" +", " ", tmp)
-    return tmp
+    return extract.html_to_text(content)
 
 
 def basic_scraper(url):
@@ -184,7 +179,25 @@ def basic_scraper(url):
         return f"An error occurred: {e}"
 
 
-def process_url(url):
+def conditional_get_request(url, cached=None):
+    headers = dict(config.REQUEST_DEFAULT_HEADERS)
+    if cached:
+        # NOTE: lets the server answer with a cheap 304 if the cached copy is still valid
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return utils.get_request(url, headers=headers)
+
+
+def process_url(url, main_content=False):
+    variant = "main" if main_content else None
+    cached = cache.lookup_scrape(url, variant)
+    if cached is not None and cached["fresh"]:
+        return url, cached["content"]
+
+    etag, last_modified = None, None
+    from_cache = False
     try:
         if url.startswith(("https://www.youtube.com", "https://youtube.com")):
             meta_data = yt_dlp_scraper(url)
@@ -216,17 +229,181 @@ def process_url(url):
                 if isinstance(meta_data[key], (dict, list)):
                     continue
                 content[key] = meta_data[key]
-        elif url.endswith(".pdf") or url.startswith(
-            ("https://arxiv.org/pdf/", "http://arxiv.org/pdf/")
-        ):
-            content = scrape_pdf_url(url)
         else:
-            content = remove_html(basic_scraper(url))
+            response = conditional_get_request(url, cached)
+            if response is not None and response.status_code == 304 and cached:
+                cache.mark_scrape_revalidated(url, variant)
+                content = cached["content"]
+                from_cache = True
+            elif url.endswith(".pdf") or url.startswith(
+                ("https://arxiv.org/pdf/", "http://arxiv.org/pdf/")
+            ):
+                content = scrape_pdf_url(url, response) if response else None
+            elif response is not None and main_content:
+                content = extract.main_content(response.text)
+            elif response is not None:
+                content = remove_html(response.text)
+            else:
+                # NOTE: a stale cached copy beats an error message
+                if cached:
+                    return url, cached["content"]
+                return url, remove_html(
+                    "An error occurred: http GET request failed due to an error code or timeout"
+                )
+
+            if response is not None and not from_cache:
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
     except:
         content = None
+
+    if content is None:
+        if cached:
+            return url, cached["content"]
+        return url, None
+
+    if not from_cache:
+        cache.store_scrape(
+            url, content, etag=etag, last_modified=last_modified, variant=variant
+        )
+
     return url, content
 
 
+class ScrapeStream:
+    """
+    Scrapes urls on a bounded thread pool and yields (url, content) pairs as soon as
+    each url finishes. Caps the total and per-host concurrency, and stops waiting
+    once the deadline passes so one slow host cannot hold up the rest, the urls
+    that did not finish in time are then yielded as (url, None).
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        max_per_host=None,
+        deadline_seconds=None,
+        main_content=False,
+    ):
+        self.max_workers = max_workers or config.SCRAPER_MAX_CONCURRENCY
+        self.max_per_host = max_per_host or config.SCRAPER_MAX_CONCURRENCY_PER_HOST
+        self.main_content = main_content
+        self.deadline = None
+        if deadline_seconds is not None:
+            self.deadline = time.monotonic() + deadline_seconds
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        )
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._active_per_host = {}
+        self._waiting_per_host = {}
+        self._outstanding = 0
+        # the submitted urls without a result yet, in the order they were submitted
+        self._pending = {}
+        self._closed = False
+
+    @staticmethod
+    def _host(url):
+        try:
+            return urlparse(url).netloc.lower()
+        except ValueError:
+            return ""
+
+    def submit(self, url):
+        host = self._host(url)
+        with self._lock:
+            self._outstanding += 1
+            self._pending[url] = self._pending.get(url, 0) + 1
+            if self._active_per_host.get(host, 0) >= self.max_per_host:
+                # NOTE: queue it instead of blocking a worker thread on a busy host
+                self._waiting_per_host.setdefault(host, []).append(url)
+                return
+            self._active_per_host[host] = self._active_per_host.get(host, 0) + 1
+        self._start(url, host)
+
+    def _start(self, url, host):
+        try:
+            future = self._executor.submit(process_url, url, self.main_content)
+        except RuntimeError:
+            # the executor was closed because the deadline passed
+            return
+        future.add_done_callback(lambda f: self._on_done(f, url, host))
+
+    def _on_done(self, future, url, host):
+        try:
+            self._results.put(future.result())
+        except Exception:
+            self._results.put((url, None))
+
+        next_url = None
+        with self._lock:
+            waiting = self._waiting_per_host.get(host)
+            if waiting and not self._closed:
+                next_url = waiting.pop(0)
+            else:
+                self._active_per_host[host] -= 1
+        if next_url is not None:
+            self._start(next_url, host)
+
+    def _timed_out(self):
+        with self._lock:
+            pending = [
+                url for url, count in self._pending.items() for _ in range(count)
+            ]
+            self._pending.clear()
+            self._outstanding = 0
+        return [(url, None) for url in pending]
+
+    def results(self):
+        while True:
+            with self._lock:
+                if self._outstanding <= 0:
+                    return
+
+            timeout = None
+            if self.deadline is not None:
+                timeout = self.deadline - time.monotonic()
+                if timeout <= 0:
+                    yield from self._timed_out()
+                    return
+
+            try:
+                result = self._results.get(timeout=timeout)
+            except queue.Empty:
+                yield from self._timed_out()
+                return
+
+            with self._lock:
+                self._outstanding -= 1
+                url = result[0]
+                if self._pending.get(url, 0) > 1:
+                    self._pending[url] -= 1
+                else:
+                    self._pending.pop(url, None)
+            yield result
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        # NOTE: never wait on the stragglers, they finish (or time out) in the background
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_all_htmls(
+    urls, deadline_seconds=config.SCRAPER_DEADLINE_SECONDS, main_content=False
+):
+    # deadline_seconds=None waits for every url, however long it takes
+    stream = ScrapeStream(deadline_seconds=deadline_seconds, main_content=main_content)
+    try:
+        for url in urls:
+            stream.submit(url)
+        yield from stream.results()
+    finally:
+        stream.close()
+
+
 def get_all_htmls(text):
     urls = None
     if type(text) == str:
@@ -238,12 +415,10 @@ def get_all_htmls(text):
     else:
         raise Exception(f"{get_all_htmls.__name__}() only excepts type list or str")
 
+    # NOTE: the user asked for exactly these urls, so slow ones (e.g. videos) are waited for
     output = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_url = {executor.submit(process_url, url): url for url in urls}
-        for future in concurrent.futures.as_completed(future_to_url):
-            url, content = future.result()
-            output[url] = content
+    for url, content in stream_all_htmls(urls, deadline_seconds=None):
+        output[url] = content
 
     return output
 
@@ -265,9 +440,10 @@ def scraped_prompt(prompt):
     )
 
 
-def scrape_pdf_url(url):
+def scrape_pdf_url(url, response=None):
     try:
-        response = utils.get_request(url)
+        if response is None:
+            response = utils.get_request(url)
         if response == None:
             raise Exception(f"HTTP GET request failed due to an error code or timeout")
 
@@ -0,0 +1,80 @@
+import threading
+import time
+import sys
+
+from cha import config
+
+
+class StreamRenderer:
+    """
+    Prints streamed chunks in batches instead of one write+flush per chunk. Chunks
+    are buffered until STREAM_FLUSH_INTERVAL_SECONDS or STREAM_FLUSH_BYTES is
+    reached, each batch is wrapped in the style (e.g. colors.green) once, and the
+    full text is only joined when it is asked for.
+    """
+
+    def __init__(self, style=None, output=None, flush_interval=None, flush_bytes=None):
+        self.style = style
+        self.output = output or sys.stdout
+        self.flush_interval = flush_interval or config.STREAM_FLUSH_INTERVAL_SECONDS
+        self.flush_bytes = flush_bytes or config.STREAM_FLUSH_BYTES
+
+        self.chunks = []
+        self.pending = []
+        self.pending_size = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.flusher = None
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        with self.lock:
+            self.chunks.append(chunk)
+            self.pending.append(chunk)
+            self.pending_size += len(chunk)
+            now = time.monotonic()
+            if (
+                self.pending_size >= self.flush_bytes
+                or now - self.last_flush >= self.flush_interval
+            ):
+                self._flush(now)
+            elif self.flusher is None:
+                self._start_flusher()
+
+    def _start_flusher(self):
+        # NOTE: without this, the tail of a batch would wait for the next chunk when the model pauses
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            with self.lock:
+                if self.pending:
+                    self._flush(time.monotonic())
+
+    def _flush(self, now):
+        # NOTE: the caller must hold self.lock
+        if self.pending:
+            text = "".join(self.pending)
+            self.output.write(self.style(text) if self.style else text)
+            self.output.flush()
+            self.pending = []
+            self.pending_size = 0
+        self.last_flush = now
+
+    def flush(self):
+        with self.lock:
+            self._flush(time.monotonic())
+
+    def close(self):
+        self.closed.set()
+        self.flush()
+        return self.text()
+
+    def text(self):
+        with self.lock:
+            if len(self.chunks) > 1:
+                self.chunks = ["".join(self.chunks)]
+            return self.chunks[0] if self.chunks else ""
@@ -1,33 +1,20 @@
 import subprocess
 import os
 
-from cha import colors, config, utils
+from cha import colors, config, utils, walk
 
 
 def collect_files(directory):
     # recursively collect selectable files from a directory
     gathered: list[str] = []
 
-    # normalize DIRS_TO_IGNORE and remove trailing slashes
-    ignored_dir_names = {
-        d.strip(os.sep) for d in config.DIRS_TO_IGNORE if d.strip(os.sep)
-    }
-
-    for root, dirnames, files in os.walk(directory, topdown=True):
-        # prevent os.walk from descending into ignored directories
-        dirnames[:] = [d for d in dirnames if d not in ignored_dir_names]
-
-        # safeguard skip files if root itself is in an ignored directory path
-        current_path_segments = set(os.path.normpath(root).split(os.sep))
-        if not ignored_dir_names.isdisjoint(current_path_segments):
-            continue  # skip files in this root
-
-        for name in files:
-            ext = os.path.splitext(name)[1].lower()
-            # check against binary extensions and specific files to ignore
-            if ext in config.BINARY_EXTENSIONS or name in config.FILES_TO_IGNORE:
-                continue
-            gathered.append(os.path.join(root, name))
+    # NOTE: ignored directories (DIRS_TO_IGNORE) are pruned by the walker before descending
+    for entry in walk.walk_files(directory):
+        ext = os.path.splitext(entry.name)[1].lower()
+        # check against binary extensions and specific files to ignore
+        if ext in config.BINARY_EXTENSIONS or entry.name in config.FILES_TO_IGNORE:
+            continue
+        gathered.append(entry.path)
 
     return gathered
 
@@ -1,12 +1,13 @@
-import statistics
 import subprocess
 import tempfile
+import threading
 import textwrap
 import random
 import base64
 import uuid
 import json
 import copy
+import time
 import math
 import sys
 import re
@@ -309,44 +310,166 @@ def is_slow_model(model_name):
     return False
 
 
-def count_tokens(text, model_name, fast_mode=False, language=None, rounding=1.25):
+_token_encoders = {}
+_token_encoders_lock = threading.Lock()
+_TOKEN_ENCODER_RETRY_SECONDS = 60
+
+
+def _token_encoding_name(model_name):
+    import tiktoken.model
+
     try:
-        if fast_mode == False:
+        return tiktoken.model.encoding_name_for_model(model_name)
+    except:
+        # NOTE: unknown models (e.g. non-openai ones) are counted with the same encoding as gpt-4o/o1
+        return "o200k_base"
+
+
+def get_token_encoder(model_name):
+    """
+    returns the tiktoken encoding for a model, loaded at most once per process and
+    shared by every model of the same family. returns None if it can not be loaded.
+    """
+    encoding_name = _token_encoding_name(model_name)
+    with _token_encoders_lock:
+        cached = _token_encoders.get(encoding_name)
+        if cached is not None:
+            encoder, failed_at = cached
+            if encoder is not None:
+                return encoder
+            # don't retry a failed (e.g. offline) download on every single count
+            if time.time() - failed_at < _TOKEN_ENCODER_RETRY_SECONDS:
+                return None
+
+        try:
             import tiktoken
 
-            try:
-                encoding = tiktoken.encoding_for_model(model_name)
-                return len(encoding.encode(text))
-            except:
-                new_model_name = "o1" if model_name.startswith("o") else "gpt-4o"
-                encoding = tiktoken.encoding_for_model(new_model_name)
-                return len(encoding.encode(text))
-
-        word_count = len(text.split())
-
-        # https://gptforwork.com/guides/openai-gpt3-tokens
-        token_multiplier = {
-            "english": 1.3,
-            "french": 2.0,
-            "german": 2.1,
-            "spanish": 2.1,
-            "chinese": 2.5,
-            "russian": 3.3,
-            "vietnamese": 3.3,
-            "arabic": 4.0,
-            "hindi": 6.4,
-        }
-
-        if language is None or str(language.lower()) not in token_multiplier:
-            tokens = word_count * statistics.median(token_multiplier.values())
-        else:
-            tokens = word_count * token_multiplier[language.lower()]
+            encoder = tiktoken.get_encoding(encoding_name)
+            _token_encoders[encoding_name] = (encoder, None)
+        except:
+            encoder = None
+            _token_encoders[encoding_name] = (None, time.time())
+        return encoder
+
+
+def loaded_token_encoder(model_name):
+    # the encoder only if it is already loaded, never loads (or downloads) it
+    with _token_encoders_lock:
+        cached = _token_encoders.get(_token_encoding_name(model_name))
+    return cached[0] if cached is not None else None
+
+
+def warm_token_encoder(model_name):
+    # loads the encoder in the background so the first token count does not block the ui
+    if not config.CHA_WARM_TOKEN_ENCODER:
+        return None
+    warmup_thread = threading.Thread(
+        target=get_token_encoder, args=(model_name,), daemon=True
+    )
+    warmup_thread.start()
+    return warmup_thread
+
+
+def estimate_tokens(text, language=None, rounding=1.25):
+    word_count = len(text.split())
+
+    # https://gptforwork.com/guides/openai-gpt3-tokens
+    token_multiplier = {
+        "english": 1.3,
+        "french": 2.0,
+        "german": 2.1,
+        "spanish": 2.1,
+        "chinese": 2.5,
+        "russian": 3.3,
+        "vietnamese": 3.3,
+        "arabic": 4.0,
+        "hindi": 6.4,
+    }
+
+    if language is None or str(language.lower()) not in token_multiplier:
+        import statistics
+
+        tokens = word_count * statistics.median(token_multiplier.values())
+    else:
+        tokens = word_count * token_multiplier[language.lower()]
+
+    return math.floor(tokens * rounding)
+
+
+def count_tokens(text, model_name, fast_mode=False, language=None, rounding=1.25):
+    try:
+        if fast_mode == False:
+            encoder = get_token_encoder(model_name)
+            if encoder is None:
+                return None
+            # NOTE: ordinary encoding treats special tokens (e.g. <|endoftext|>) as plain text instead of raising
+            return len(encoder.encode_ordinary(text))
 
-        return math.floor(tokens * rounding)
+        return estimate_tokens(text, language, rounding)
     except:
         return None
 
 
+def count_tokens_batch(
+    texts, model_name, fast_mode=False, language=None, rounding=1.25
+):
+    """
+    counts the tokens of many strings in one call, encoding them in parallel with
+    tiktoken's batch api. returns a list of counts, or None for every text on failure.
+    """
+    texts = list(texts)
+    try:
+        if fast_mode == False:
+            encoder = get_token_encoder(model_name)
+            if encoder is None:
+                return [None] * len(texts)
+            return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+        return [estimate_tokens(text, language, rounding) for text in texts]
+    except:
+        return [None] * len(texts)
+
+
+_http_sessions = {}
+_http_sessions_lock = threading.Lock()
+
+
+def get_http_session(retry_count=config.REQUEST_DEFAULT_RETRY_COUNT):
+    """
+    returns a shared, keep-alive requests session (one per retry count) so
+    repeated requests to the same host reuse their TCP/TLS connections.
+    """
+    with _http_sessions_lock:
+        session = _http_sessions.get(retry_count)
+        if session is not None:
+            return session
+
+        from requests.packages.urllib3.util.retry import Retry
+        from requests.adapters import HTTPAdapter
+        import requests
+
+        retries = Retry(
+            total=retry_count,
+            backoff_factor=config.REQUEST_BACKOFF_FACTOR,
+            status_forcelist=list(range(400, 600)),
+        )
+
+        # NOTE: urllib3 keeps one connection pool per host, pool_maxsize caps the connections per host
+        adapter = HTTPAdapter(
+            pool_connections=config.REQUEST_POOL_HOST_COUNT,
+            pool_maxsize=config.REQUEST_POOL_MAX_CONNECTIONS_PER_HOST,
+            pool_block=config.REQUEST_POOL_BLOCK_WHEN_FULL,
+            max_retries=retries,
+        )
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        _http_sessions[retry_count] = session
+        return session
+
+
 def get_request(
     url,
     timeout=config.REQUEST_DEFAULT_TIMEOUT_SECONDS,
@@ -354,19 +477,9 @@ def get_request(
     headers=config.REQUEST_DEFAULT_HEADERS,
     debug_mode=False,
 ):
-    from requests.packages.urllib3.util.retry import Retry
-    from requests.adapters import HTTPAdapter
     import requests
 
-    retries = Retry(
-        total=retry_count,
-        backoff_factor=config.REQUEST_BACKOFF_FACTOR,
-        status_forcelist=list(range(400, 600)),
-    )
-
-    session = requests.Session()
-    session.mount("http://", HTTPAdapter(max_retries=retries))
-    session.mount("https://", HTTPAdapter(max_retries=retries))
+    session = get_http_session(retry_count)
 
     try:
         response = session.get(url, timeout=timeout, headers=headers)
@@ -379,6 +492,35 @@ def get_request(
         return None
 
 
+class TokenBucket:
+    """
+    A thread-safe token bucket, acquire() blocks until a token is free. It refills
+    at rate tokens per second up to burst tokens, so bursts are allowed while the
+    long run average stays at the rate.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(float(burst), 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
 def safe_input(message=""):
     try:
         return input(message)
@@ -392,6 +534,55 @@ def write_json(path, data):
         json.dump(data, file, indent=4)
 
 
+def write_bytes_atomic(path, data):
+    """
+    Writes the file next to its final name and renames it into place, so a reader
+    never sees it half written and a crash leaves the previous version intact.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, str(path))
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(path, data, indent=None):
+    write_bytes_atomic(path, json.dumps(data, indent=indent).encode("utf-8"))
+
+
+def local_cache_enabled(setting=True):
+    # caches and indexes only live in a ~/.cha/ the user set up, cha never creates it on their behalf
+    return bool(setting) and os.path.isdir(config.LOCAL_CHA_CONFIG_DIR)
+
+
+def open_cache_db(db_name, schema):
+    """
+    opens a SQLite database in ~/.cha/cache/ and creates its tables from the schema
+    statements. the connection may be used from any thread, callers serialize access
+    with their own lock. returns None without a ~/.cha/ setup.
+    """
+    if not local_cache_enabled():
+        return None
+
+    import sqlite3
+
+    os.makedirs(config.LOCAL_CHA_CONFIG_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(
+        os.path.join(config.LOCAL_CHA_CONFIG_CACHE_DIR, db_name),
+        timeout=5,
+        check_same_thread=False,
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    for statement in schema:
+        connection.execute(statement)
+    connection.commit()
+    return connection
+
+
 def copy_to_clipboard(text):
     platform = sys.platform
     try:
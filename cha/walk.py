@@ -0,0 +1,176 @@
+import concurrent.futures
+import fnmatch
+import os
+
+from cha import config
+
+# NOTE: one scandir based walker shared by codedump, traverse, and nav
+
+
+class WalkEntry:
+    """
+    A file (or directory) found by the walker. Wraps the os.DirEntry so the type
+    checks and stat() reuse the data scandir already fetched.
+    """
+
+    __slots__ = ("entry", "rel_path")
+
+    def __init__(self, entry, rel_path):
+        self.entry = entry
+        self.rel_path = rel_path
+
+    @property
+    def name(self):
+        return self.entry.name
+
+    @property
+    def path(self):
+        return self.entry.path
+
+    def stat(self):
+        return self.entry.stat()
+
+    def __repr__(self):
+        return f"WalkEntry({self.rel_path!r})"
+
+
+def compile_ignored_dirs(patterns=None):
+    """
+    Splits DIRS_TO_IGNORE style entries (e.g. "node_modules/", "*.egg-info/") into a
+    set of exact names and a list of globs, so most checks are a set lookup.
+    """
+    if patterns is None:
+        patterns = config.DIRS_TO_IGNORE
+
+    names, globs = set(), []
+    for pattern in patterns:
+        pattern = pattern.strip().strip("/").strip(os.sep)
+        if not pattern:
+            continue
+        if any(char in pattern for char in "*?["):
+            globs.append(pattern)
+        else:
+            names.add(pattern)
+    return names, globs
+
+
+def is_ignored_dir_name(name, ignored_dirs):
+    names, globs = ignored_dirs
+    if name in names:
+        return True
+    return any(fnmatch.fnmatchcase(name, glob) for glob in globs)
+
+
+def _load_gitignore(dir_path):
+    import pathspec
+
+    try:
+        with open(os.path.join(dir_path, ".gitignore"), "r", encoding="utf-8") as f:
+            return pathspec.PathSpec.from_lines("gitwildmatch", f.read().splitlines())
+    except:
+        return None
+
+
+def _is_gitignored(rel_path, is_dir, gitignores):
+    # the deepest .gitignore with a matching (or negating) pattern wins, like git itself
+    for base, spec in reversed(gitignores):
+        rel_to_base = rel_path[len(base) + 1 :] if base else rel_path
+        if is_dir:
+            rel_to_base += "/"
+        result = spec.check_file(rel_to_base).include
+        if result is not None:
+            return result
+    return False
+
+
+def _scan_dir(dir_path, rel_dir, gitignores, ignored_dirs, use_gitignore):
+    try:
+        with os.scandir(dir_path) as iterator:
+            entries = sorted(iterator, key=lambda entry: entry.name)
+    except OSError:
+        return [], []
+
+    if use_gitignore and any(entry.name == ".gitignore" for entry in entries):
+        spec = _load_gitignore(dir_path)
+        if spec is not None:
+            gitignores = gitignores + [(rel_dir, spec)]
+
+    files, subdirs = [], []
+    for entry in entries:
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+
+        if is_dir:
+            # NOTE: like os.walk, symlinked directories are never descended into
+            if entry.is_symlink() or is_ignored_dir_name(entry.name, ignored_dirs):
+                continue
+            if use_gitignore and (
+                entry.name == ".git" or _is_gitignored(rel_path, True, gitignores)
+            ):
+                continue
+            subdirs.append((entry.path, rel_path, gitignores))
+        else:
+            if use_gitignore and _is_gitignored(rel_path, False, gitignores):
+                continue
+            files.append(WalkEntry(entry, rel_path))
+    return files, subdirs
+
+
+def walk_files(root_path, ignored_dirs=None, use_gitignore=False, max_workers=None):
+    """
+    Yields a WalkEntry for every file under root_path, top-down and sorted by name.
+    Ignored directories (DIRS_TO_IGNORE by default) are pruned before they are
+    descended into, and with use_gitignore every nested .gitignore is honored. With
+    max_workers > 1, subdirectories are scanned ahead on a thread pool while the
+    output keeps the same order.
+    """
+    if ignored_dirs is None:
+        ignored_dirs = compile_ignored_dirs()
+    elif not isinstance(ignored_dirs, tuple):
+        ignored_dirs = compile_ignored_dirs(ignored_dirs)
+
+    def scan(dir_path, rel_dir, gitignores):
+        return _scan_dir(dir_path, rel_dir, gitignores, ignored_dirs, use_gitignore)
+
+    if not max_workers or max_workers <= 1:
+        stack = [(root_path, "", [])]
+        while stack:
+            files, subdirs = scan(*stack.pop())
+            yield from files
+            stack.extend(reversed(subdirs))
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def walk_parallel(future):
+            files, subdirs = future.result()
+            sub_futures = [executor.submit(scan, *subdir) for subdir in subdirs]
+            yield from files
+            for sub_future in sub_futures:
+                yield from walk_parallel(sub_future)
+
+        yield from walk_parallel(executor.submit(scan, root_path, "", []))
+
+
+def list_dirs(dir_path, ignored_dirs=None):
+    # the sorted names of the directories (symlinks to directories included) in dir_path
+    if ignored_dirs is not None and not isinstance(ignored_dirs, tuple):
+        ignored_dirs = compile_ignored_dirs(ignored_dirs)
+
+    names = []
+    with os.scandir(dir_path) as iterator:
+        for entry in iterator:
+            try:
+                if not entry.is_dir():
+                    continue
+            except OSError:
+                continue
+            if ignored_dirs is not None and is_ignored_dir_name(
+                entry.name, ignored_dirs
+            ):
+                continue
+            names.append(entry.name)
+    return sorted(names)